@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from core.permissions import check_shared_cache
+        from core.routes import entity_routes
+        from core.signals import connect_file_models, connect_permission_models, connect_user_cache
+        check_shared_cache()
+        connect_file_models()
+        connect_permission_models()
+        connect_user_cache()
+        entity_routes.autodiscover()
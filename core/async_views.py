@@ -0,0 +1,71 @@
+import functools
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework.exceptions import APIException, NotAuthenticated, ParseError
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .authentication import ClaimsJWTAuthentication
+from .serializers import LoginSerializer, RefreshSerializer
+
+
+def error_response(exception):
+    detail = exception.detail if isinstance(exception.detail, (dict, list)) else {'detail': exception.detail}
+    return JsonResponse(detail, status=exception.status_code, safe=False)
+
+
+def async_api_view(methods, authenticated=True):
+    """
+    Turn an async function into a JSON API view for ASGI servers, without DRF's sync request cycle.
+    Requests are authenticated from their JWT (request.user is set) and DRF API exceptions become error responses.
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+            try:
+                if authenticated:
+                    auth = await ClaimsJWTAuthentication().aauthenticate(request)
+                    if auth is None:
+                        raise NotAuthenticated()
+                    request.user, request.auth = auth
+                return await view(request, *args, **kwargs)
+            except APIException as e:
+                return error_response(e)
+
+        # csrf_exempt only wraps sync views in Django 4.2
+        wrapper.csrf_exempt = True
+        return wrapper
+
+    return decorator
+
+
+def request_data(request):
+    if not request.body:
+        return {}
+    try:
+        return json.loads(request.body)
+    except ValueError as e:
+        raise ParseError(f'JSON parse error - {e}')
+
+
+async def validate_token_serializer(serializer):
+    # password hashing and token signing are CPU bound, the login also reads the user and its permissions
+    try:
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+    except TokenError as e:
+        raise InvalidToken(e.args[0])
+    return JsonResponse(serializer.validated_data)
+
+
+@async_api_view(['POST'], authenticated=False)
+async def login(request):
+    return await validate_token_serializer(LoginSerializer(data=request_data(request), context={'request': request}))
+
+
+@async_api_view(['POST'], authenticated=False)
+async def refresh(request):
+    return await validate_token_serializer(RefreshSerializer(data=request_data(request), context={'request': request}))
@@ -0,0 +1,142 @@
+import functools
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.admin.models import LogEntry
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_current_buffer = ContextVar('audit_buffer', default=None)
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _write_entries(entries, background=False):
+    for entry in entries:
+        if not isinstance(entry.change_message, str):
+            entry.change_message = json.dumps(entry.change_message)
+    try:
+        LogEntry.objects.bulk_create(entries, batch_size=500)
+    except Exception:
+        if not background:
+            raise
+        logger.exception('Could not write %s audit log entries', len(entries))
+    finally:
+        if background:
+            close_old_connections()
+
+
+def _get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='audit')
+        return _writer
+
+
+def _submit_entries(entries):
+    if not entries:
+        return
+    if settings.AUDIT_WRITER == 'background':
+        _get_writer().submit(_write_entries, entries, True)
+    else:
+        _write_entries(entries)
+
+
+class AuditBuffer:
+    """
+    Collects LogEntry rows created through EntityModel.log_action and writes them with one bulk_create per
+    transaction. Entries added inside an atomic block are written once it commits (dropped if it rolls back),
+    the others when the buffered block (the request) ends. The entries of a block ending with an exception
+    are dropped.
+    With settings.AUDIT_WRITER = 'background' the insert is handed to a background thread instead.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self._transactions = {}
+
+    def add(self, entry):
+        connection = transaction.get_connection()
+        if not connection.in_atomic_block:
+            self.entries.append(entry)
+            return entry
+        # one flush per transaction (or savepoint), which Django discards if it rolls back
+        key = (connection.alias, tuple(connection.savepoint_ids))
+        callback, entries = self._transactions.get(key, (None, None))
+        if callback is None or not any(item[1] is callback for item in connection.run_on_commit):
+            entries = []
+            callback = functools.partial(self._commit, key, entries)
+            self._transactions[key] = (callback, entries)
+            transaction.on_commit(callback)
+        entries.append(entry)
+        return entry
+
+    def _commit(self, key, entries):
+        self._transactions.pop(key, None)
+        _submit_entries(entries)
+
+    def flush(self):
+        # the batches of transactions still registered here were rolled back
+        entries, self.entries = self.entries, []
+        self._transactions.clear()
+        _submit_entries(entries)
+
+    def discard(self):
+        self.entries = []
+        self._transactions.clear()
+
+
+def get_audit_buffer():
+    return _current_buffer.get()
+
+
+@contextmanager
+def audit_buffer():
+    """
+    Buffer the log actions of the enclosed block. Nested blocks share the outer buffer.
+    Outside of a block (scripts, shell) log actions are written right away.
+    If the block raises, the entries not yet committed with a transaction are dropped.
+    """
+    buffer = _current_buffer.get()
+    if buffer is not None:
+        yield buffer
+        return
+    buffer = AuditBuffer()
+    token = _current_buffer.set(buffer)
+    try:
+        yield buffer
+    except BaseException:
+        buffer.discard()
+        raise
+    finally:
+        _current_buffer.reset(token)
+    buffer.flush()
+
+
+@asynccontextmanager
+async def async_audit_buffer():
+    """
+    audit_buffer for async code, the entries are written from a worker thread.
+    """
+    buffer = _current_buffer.get()
+    if buffer is not None:
+        yield buffer
+        return
+    buffer = AuditBuffer()
+    token = _current_buffer.set(buffer)
+    try:
+        yield buffer
+    except BaseException:
+        buffer.discard()
+        raise
+    finally:
+        _current_buffer.reset(token)
+    await sync_to_async(buffer.flush)()
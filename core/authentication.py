@@ -0,0 +1,179 @@
+import copy
+import threading
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from core.fns import LRUCache
+from core.permissions import prime_from_claims
+
+# per request state that must not be shared through the cache
+REQUEST_ATTRIBUTES = ('_perm_cache', '_user_perm_cache', '_group_perm_cache', '_permission_snapshot')
+
+
+class UserCache:
+    """
+    Users resolved from access tokens, kept in a bounded in-process LRU keyed by (user id, token iat) for
+    USER_CACHE_LOCAL_TTL seconds, backed by the Django cache for USER_CACHE_TIMEOUT seconds.
+
+    The shared entry holds the user row, the same for every token of the user, so it is keyed by user id only:
+    the token itself is checked on every request (expiry, active user, revoked password). It is stored with the
+    per user version read before the user was loaded, and only used while that version is current. Saving or
+    deleting the user bumps the version (see core.signals), which also discards an entry written concurrently
+    from a row loaded before the save. Other processes see it once their local entry expires, so the Django
+    cache must be shared (see core.permissions.check_shared_cache).
+    Every call returns a copy, so per request state (permission caches, last_seen) does not leak between requests.
+    """
+
+    def __init__(self, maxsize=None):
+        self._local = LRUCache(maxsize or settings.USER_CACHE_SIZE)
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def cache_key(user_id):
+        return f'jwt_user:{user_id}'
+
+    @staticmethod
+    def version_key(user_id):
+        return f'jwt_user_version:{user_id}'
+
+    def version(self, user_id):
+        return cache.get(self.version_key(user_id)) or self._bump_version(user_id)
+
+    def _bump_version(self, user_id):
+        version = uuid.uuid4().hex[:12]
+        cache.set(self.version_key(user_id), version, None)
+        return version
+
+    def get(self, user_id, issued_at):
+        entry = self._local.get((user_id, issued_at))
+        if entry is not None and entry[0] > time.monotonic():
+            self._count('local_hits')
+            return copy.copy(entry[1])
+        cache_key, version_key = self.cache_key(user_id), self.version_key(user_id)
+        values = cache.get_many([cache_key, version_key])
+        shared = values.get(cache_key)
+        if shared is None or shared[0] != values.get(version_key):
+            self._count('misses')
+            return None
+        user = shared[1]
+        self._count('shared_hits')
+        self._local.set((user_id, issued_at), (time.monotonic() + settings.USER_CACHE_LOCAL_TTL, user))
+        return copy.copy(user)
+
+    def set(self, user, issued_at, version):
+        """
+        Args:
+            version (str): The version read (see version()) before the user was loaded.
+        """
+        user = copy.copy(user)
+        for attribute in REQUEST_ATTRIBUTES:
+            user.__dict__.pop(attribute, None)
+        user._state.fields_cache = {}
+        cache.set(self.cache_key(user.pk), (version, user), settings.USER_CACHE_TIMEOUT)
+        self._local.set((user.pk, issued_at), (time.monotonic() + settings.USER_CACHE_LOCAL_TTL, user))
+
+    def invalidate(self, user_id):
+        self._bump_version(user_id)
+        cache.delete(self.cache_key(user_id))
+        for key in self._local.keys():
+            if key[0] == user_id:
+                self._local.pop(key)
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self):
+        requests = self.local_hits + self.shared_hits + self.misses
+        return {
+            'local_hits': self.local_hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.local_hits + self.shared_hits) / requests, 3) if requests else None,
+            'size': len(self._local),
+        }
+
+
+user_cache = UserCache()
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication resolving users through the user cache (settings.USER_CACHE_TIMEOUT) and answering
+    permission checks from the group and permission claims of the access token (settings.JWT_PERMISSION_CLAIMS)
+    while their version stamp is current, otherwise they are loaded as usual.
+    """
+
+    def get_user(self, validated_token):
+        if settings.USER_CACHE_TIMEOUT:
+            user = self.get_cached_user(validated_token)
+        else:
+            user = super().get_user(validated_token)
+        if settings.JWT_PERMISSION_CLAIMS:
+            prime_from_claims(user, validated_token)
+        return user
+
+    def get_cached_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+        issued_at = validated_token.get('iat')
+        user = user_cache.get(user_id, issued_at)
+        if user is None:
+            # read first, a save while loading leaves the cached user outdated rather than used
+            version = user_cache.version(user_id)
+            user = super().get_user(validated_token)
+            user_cache.set(user, issued_at, version)
+            return user
+        # cached users are dropped when they are saved, the checks of get_user still apply
+        self.check_user(user, validated_token)
+        return user
+
+    def check_user(self, user, validated_token):
+        # the checks of JWTAuthentication.get_user
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN and \
+                validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+    async def aauthenticate(self, request):
+        """
+        authenticate() for async views.
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        if settings.USER_CACHE_TIMEOUT or settings.JWT_PERMISSION_CLAIMS:
+            # cache lookups, and loading stale permissions, are synchronous
+            return await sync_to_async(self.get_user)(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+        try:
+            user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        self.check_user(user, validated_token)
+        return user
@@ -0,0 +1,289 @@
+"""
+Offline micro benchmarks for the core.fns helpers, run with `python manage.py benchmark`.
+"""
+import json
+import math
+import platform
+import timeit
+import tracemalloc
+
+from django.test.utils import override_settings
+
+from core.fns import ALPHABET_SIZE, unit_codes, to_codes, to_base_26, get_rank_between, get_ranks_between, \
+    get_default_ranks, flatten_dict, FlatView, replace_placeholders, media_url, sanitize_html, get_object_view_link, \
+    changed_fields, _sanitized
+
+BENCHMARKS = {}
+
+# fixed settings so the results do not depend on the environment
+BENCHMARK_SETTINGS = {
+    'STORAGE_URL': 'https://storage.example.com/media/',
+    'STORAGE_TOKEN': '?sv=2022-11-02&ss=b&srt=o&sp=r&se=2030-01-01T00:00:00Z&sig=c2lnbmF0dXJl',
+    'FRONTEND_APP_DIR': 'https://app.example.com/frontend',
+}
+
+
+def benchmark(suite, name=None):
+    """
+    Register a benchmark. The decorated function takes no arguments and runs one operation.
+    """
+
+    def decorator(fn):
+        BENCHMARKS[f'{suite}.{name or fn.__name__}'] = fn
+        return fn
+
+    return decorator
+
+
+def measure(fn, min_time=0.2):
+    """
+    Returns:
+        dict: ops_per_sec (best of 3 rounds) and alloc_bytes, the peak memory allocated by one call.
+    """
+    timer = timeit.Timer(fn)
+    number, __ = timer.autorange()
+    number = max(number, int(number * min_time / 0.2))
+    elapsed = min(timer.repeat(repeat=3, number=number))
+
+    tracemalloc.start()
+    try:
+        fn()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        fn()
+        alloc_bytes = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    return {'ops_per_sec': number / elapsed, 'alloc_bytes': alloc_bytes}
+
+
+def run_benchmarks(pattern=None, min_time=0.2):
+    with override_settings(**BENCHMARK_SETTINGS):
+        return {name: measure(fn, min_time) for name, fn in BENCHMARKS.items() if not pattern or pattern in name}
+
+
+def save_results(path, results):
+    with open(path, 'w') as f:
+        json.dump({'python': platform.python_version(), 'results': results}, f, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def compare_results(baseline, results):
+    """
+    Returns:
+        dict: name -> relative speed change against the baseline (-0.1 is 10% slower), for benchmarks in both runs.
+    """
+    return {name: result['ops_per_sec'] / baseline[name]['ops_per_sec'] - 1
+            for name, result in results.items() if name in baseline}
+
+
+# Ranks: the float based implementations the exact engine replaced, kept as the baseline
+
+def legacy_list_to_base_10(values):
+    result = 0
+    length = len(values)
+    for i in range(length):
+        result += values[i] * math.pow(ALPHABET_SIZE + 1, length - 1 - i)
+    return int(result)
+
+
+def legacy_get_rank_between(first_rank, second_rank):
+    if not second_rank > first_rank:
+        raise ValueError(f"secondRank must be greater than firstRank! {second_rank} is not greater than {first_rank}")
+    # make positions equal
+    while len(first_rank) != len(second_rank):
+        if len(first_rank) > len(second_rank):
+            second_rank += 'a'
+        else:
+            first_rank += 'a'
+    first_base_10 = legacy_list_to_base_10(to_codes(first_rank))
+    second_base_10 = legacy_list_to_base_10(to_codes(second_rank))
+    if (second_base_10 - first_base_10) <= 1:
+        return first_rank + 'n'
+    middle = int((first_base_10 + second_base_10) // 2)
+    return to_base_26(middle)
+
+
+def legacy_get_rank_between2(first_rank, second_rank):
+    if not second_rank > first_rank:
+        raise ValueError(f"secondRank must be greater than firstRank! {second_rank} is not greater than {first_rank}")
+    # make positions equal
+    while len(first_rank) != len(second_rank):
+        if len(first_rank) > len(second_rank):
+            second_rank += 'a'
+        else:
+            first_rank += 'a'
+    first_position_codes = unit_codes(first_rank)
+    second_position_codes = unit_codes(second_rank)
+
+    difference = 0
+
+    for index, first_code in reversed(list(enumerate(first_position_codes))):
+        second_code = second_position_codes[index]
+        if second_code < first_code:
+            second_code += ALPHABET_SIZE
+            second_position_codes[index - 1] -= 1
+
+        # formula: x = a * size^0 + b * size^1 + c * size^2
+        pow_res = math.pow(ALPHABET_SIZE, len(first_rank) - index - 1)
+        difference += (second_code - first_code) * pow_res
+
+    new_element = ''
+    if difference <= 1:
+        # add middle char from alphabet
+        new_element = first_rank + chr(ord('a') + ALPHABET_SIZE // 2)
+    else:
+        difference = difference // 2
+        offset = 0
+        for index, first_code in enumerate(first_rank):
+            # formula: x = difference / (size ^ place - 1) % size;
+            # i.e.difference = 110, size = 10, we want place 2(middle),
+            # then x = 100 / 10 ^ (2 - 1) % 10 = 100 / 10 % 10 = 11 % 10 = 1
+            diff_in_symbols = difference // math.pow(ALPHABET_SIZE, index) % ALPHABET_SIZE
+            new_element_code = ord(first_rank[len(second_rank) - index - 1]) + diff_in_symbols + offset
+
+            # if newElement is greater then 'z'
+            if new_element_code > ord('z'):
+                offset += 1
+                new_element_code -= ALPHABET_SIZE
+            new_element += chr(int(new_element_code))
+
+        new_element = ''.join(reversed(list(new_element)))
+
+    return new_element
+
+
+SHORT_RANKS = ('abc', 'tuv')
+LONG_RANKS = ('abcdefghijklmnop', 'abcdefghijklmnoz')
+
+
+@benchmark('ranks')
+def legacy_between_short():
+    legacy_get_rank_between(*SHORT_RANKS)
+
+
+@benchmark('ranks')
+def legacy2_between_short():
+    legacy_get_rank_between2(*SHORT_RANKS)
+
+
+@benchmark('ranks')
+def between_short():
+    get_rank_between(*SHORT_RANKS)
+
+
+@benchmark('ranks')
+def legacy_between_long():
+    legacy_get_rank_between(*LONG_RANKS)
+
+
+@benchmark('ranks')
+def between_long():
+    get_rank_between(*LONG_RANKS)
+
+
+@benchmark('ranks')
+def legacy_insert_100():
+    # 100 inserts one after the other between two neighbours
+    first, second = SHORT_RANKS
+    for __ in range(100):
+        first = legacy_get_rank_between(first, second)
+
+
+@benchmark('ranks')
+def between_100():
+    get_ranks_between(*SHORT_RANKS, count=100)
+
+
+@benchmark('ranks')
+def default_ranks_10k():
+    get_default_ranks(10000)
+
+
+@benchmark('ranks')
+def default_ranks_1m():
+    get_default_ranks(1000000)
+
+
+# Helpers used in request hot paths
+
+NOTIFICATION_DATA = {
+    'user': {'id': 42, 'first_name': 'Ada', 'last_name': 'Lovelace', 'email': 'ada@example.com'},
+    'job_hub': {
+        'id': 7, 'name': 'Summer exhibition', 'client': {'id': 3, 'name': 'Gallery', 'contacts': ['a', 'b']},
+        'items': [{'id': i, 'title': f'Item {i}', 'dimensions': {'width': 10, 'height': 20}} for i in range(20)],
+    },
+    'link': 'https://app.example.com/frontend/app/job_hub/7',
+}
+
+HTML_CONTENT = ''.join(
+    f'<p>Paragraph {i} with <strong>bold</strong>, <em>emphasis</em> and a <a href="https://example.com/{i}" '
+    f'target="_blank" onclick="steal()">link</a>.</p><script>alert({i})</script>'
+    f'<ul><li>One</li><li>Two <img src="/media/{i}.jpg" alt="img" style="width: 10px"></li></ul>'
+    for i in range(20)
+)
+
+
+class BenchmarkInstance:
+    # a stand-in for a model instance, changed_fields only reads attributes
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+CHANGED_INSTANCE = BenchmarkInstance(**{f'field_{i}': i for i in range(20)})
+CHANGED_DATA = {f'field_{i}': i if i % 4 else -i for i in range(20)}
+
+
+@benchmark('fns')
+def flatten_dict_nested():
+    flatten_dict(NOTIFICATION_DATA)
+
+
+@benchmark('fns')
+def flat_view_template():
+    # what Notification.notify_user does: resolve only the placeholders of the template
+    replace_placeholders('Hello {user_first_name}, {job_hub_name} was updated: {link}', FlatView(NOTIFICATION_DATA))
+
+
+@benchmark('fns')
+def media_url_storage():
+    media_url('entity_files/artwork/12/image.jpg')
+
+
+@benchmark('fns')
+def media_url_frontend():
+    media_url('/media/entity_files/artwork/12/image.jpg', frontend=True)
+
+
+@benchmark('fns')
+def sanitize_html_2kb():
+    sanitize_html(HTML_CONTENT[:2048])
+
+
+@benchmark('fns')
+def sanitize_html_2kb_uncached():
+    _sanitized.clear()
+    sanitize_html(HTML_CONTENT[:2048])
+
+
+@benchmark('fns')
+def sanitize_html_20kb():
+    sanitize_html(HTML_CONTENT)
+
+
+@benchmark('fns')
+def object_view_link():
+    get_object_view_link('artwork', 12)
+    get_object_view_link('purchaseorder', 5, 7)
+    get_object_view_link('messaging', 3)
+    get_object_view_link('contact', 9)
+
+
+@benchmark('fns')
+def changed_fields_20():
+    changed_fields(CHANGED_INSTANCE, CHANGED_DATA)
@@ -0,0 +1,46 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# unlike thread locals, context variables follow a request through coroutines and sync_to_async threads,
+# so concurrent requests of an ASGI worker each see their own user
+_current_request = ContextVar('current_request', default=None)
+_current_user = ContextVar('current_user', default=None)
+
+
+def get_current_user():
+    """
+    The user of the current request (resolved lazily, DRF sets it once authenticated),
+    or the user set with current_user() outside of requests.
+    """
+    user = _current_user.get()
+    if user is None:
+        request = _current_request.get()
+        if request is not None:
+            user = getattr(request, 'user', None)
+    return user
+
+
+def get_current_authenticated_user():
+    user = get_current_user()
+    return user if user is not None and user.is_authenticated else None
+
+
+@contextmanager
+def current_request(request):
+    token = _current_request.set(request)
+    try:
+        yield request
+    finally:
+        _current_request.reset(token)
+
+
+@contextmanager
+def current_user(user):
+    """
+    Act as `user` in the enclosed block, e.g. in scripts and background jobs.
+    """
+    token = _current_user.set(user)
+    try:
+        yield user
+    finally:
+        _current_user.reset(token)
@@ -0,0 +1,123 @@
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+def file_etag(instance):
+    if instance.content_hash:
+        return f'"{instance.content_hash}"'
+    return f'"{instance.pk}-{int(instance.updated_at.timestamp())}"'
+
+
+def parse_range(header, size):
+    """
+    Parse a single byte range ("bytes=start-end", "bytes=start-" or "bytes=-suffix").
+
+    Returns:
+        tuple: (start, end) inclusive, None when there is no usable range (multiple ranges are served in full),
+        or False when the range can not be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _range_ok(request, etag, last_modified):
+    # If-Range: only honour the range when the client copy is still current
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(last_modified.timestamp())
+
+
+def _read_range(file, start, length):
+    try:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(STREAM_BLOCK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def _stream_response(request, instance, etag, last_modified):
+    size = instance.file_size if instance.file_size is not None else instance.file.size
+    byte_range = parse_range(request.headers.get('Range'), size) \
+        if _range_ok(request, etag, last_modified) else None
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    file = instance.file.storage.open(instance.file.name, 'rb')
+    if byte_range is None:
+        response = FileResponse(file)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(_read_range(file, start, end - start + 1), status=206)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def serve_file(request, instance, as_attachment=True):
+    """
+    Respond with the file of a BaseFile row.
+
+    With settings.SENDFILE_BACKEND set to 'nginx' (X-Accel-Redirect) or 'apache' (X-Sendfile)
+    the transfer, including range requests, is handed off to the front web server.
+    Otherwise the file is streamed with Range / If-Range support.
+    ETag and Last-Modified come from the row, so conditional requests are answered without touching the storage.
+    """
+    etag = file_etag(instance)
+    last_modified = instance.updated_at
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+    if not_modified is not None:
+        if not_modified.status_code == 304:
+            # a 304 carries the validators the 200 would have had
+            not_modified['ETag'] = etag
+            not_modified['Last-Modified'] = http_date(last_modified.timestamp())
+        return not_modified
+
+    backend = settings.SENDFILE_BACKEND
+    if backend == 'nginx':
+        response = HttpResponse()
+        response['X-Accel-Redirect'] = settings.SENDFILE_URL_PREFIX.rstrip('/') + '/' + quote(instance.file.name)
+    elif backend == 'apache':
+        response = HttpResponse()
+        response['X-Sendfile'] = os.path.join(settings.MEDIA_ROOT, instance.file.name)
+    else:
+        response = _stream_response(request, instance, etag, last_modified)
+        if response.status_code == 416:
+            return response
+
+    # front servers take the content type from the headers of the redirect response
+    response['Content-Type'] = instance.mime_type or 'application/octet-stream'
+    disposition = 'attachment' if as_attachment else 'inline'
+    response['Content-Disposition'] = f"{disposition}; filename*=UTF-8''{quote(instance.name)}"
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
@@ -1,20 +1,27 @@
-import math
+import functools
+import hashlib
 import json
 import random
+import re
 import secrets
 import string
-from urllib.parse import urljoin, urlparse
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
 import bleach
 from django.conf import settings
 from rest_framework import permissions
 
+from core.media import get_media_url_builder
+from core.permissions import user_groups
+from core.routes import entity_routes
+
 ALPHABET_SIZE = 26
 
 
 def user_is_artist(user):
-    if user:
-        return 'Artists' in user.groups.values_list('name', flat=True)
-    return False
+    return 'Artists' in user_groups(user)
 
 
 def unit_codes(val):
@@ -26,52 +33,8 @@ def unit_codes(val):
 
 # implement lexo ranking
 def get_rank_between2(first_rank, second_rank):
-    if not second_rank > first_rank:
-        raise ValueError(f"secondRank must be greater than firstRank! {second_rank} is not greater than {first_rank}")
-    # make positions equal
-    while len(first_rank) != len(second_rank):
-        if len(first_rank) > len(second_rank):
-            second_rank += 'a'
-        else:
-            first_rank += 'a'
-    first_position_codes = unit_codes(first_rank)
-    second_position_codes = unit_codes(second_rank)
-
-    difference = 0
-
-    for index, first_code in reversed(list(enumerate(first_position_codes))):
-        second_code = second_position_codes[index]
-        if second_code < first_code:
-            second_code += ALPHABET_SIZE
-            second_position_codes[index - 1] -= 1
-
-        # formula: x = a * size^0 + b * size^1 + c * size^2
-        pow_res = math.pow(ALPHABET_SIZE, len(first_rank) - index - 1)
-        difference += (second_code - first_code) * pow_res
-
-    new_element = ''
-    if difference <= 1:
-        # add middle char from alphabet
-        new_element = first_rank + chr(ord('a') + ALPHABET_SIZE // 2)
-    else:
-        difference = difference // 2
-        offset = 0
-        for index, first_code in enumerate(first_rank):
-            # formula: x = difference / (size ^ place - 1) % size;
-            # i.e.difference = 110, size = 10, we want place 2(middle),
-            # then x = 100 / 10 ^ (2 - 1) % 10 = 100 / 10 % 10 = 11 % 10 = 1
-            diff_in_symbols = difference // math.pow(ALPHABET_SIZE, index) % ALPHABET_SIZE
-            new_element_code = ord(first_rank[len(second_rank) - index - 1]) + diff_in_symbols + offset
-
-            # if newElement is greater then 'z'
-            if new_element_code > ord('z'):
-                offset += 1
-                new_element_code -= ALPHABET_SIZE
-            new_element += chr(int(new_element_code))
-
-        new_element = ''.join(reversed(list(new_element)))
-
-    return new_element
+    # kept for existing callers, ranks are computed by the exact engine below
+    return get_rank_between(first_rank, second_rank)
 
 
 def quotient_remainder(number, divisor):
@@ -86,8 +49,8 @@ def list_to_base_10(values):
     result = 0
     length = len(values)
     for i in range(length):
-        result += values[i] * math.pow(ALPHABET_SIZE + 1, length - 1 - i)
-    return int(result)
+        result += values[i] * (ALPHABET_SIZE + 1) ** (length - 1 - i)
+    return result
 
 
 def str_to_base_10(val):
@@ -113,72 +76,122 @@ def to_base_26(val):
     return result
 
 
-def get_rank_between(first_rank, second_rank):
-    if not second_rank > first_rank:
-        raise ValueError(f"secondRank must be greater than firstRank! {second_rank} is not greater than {first_rank}")
-    # make positions equal
-    while len(first_rank) != len(second_rank):
-        if len(first_rank) > len(second_rank):
-            second_rank += 'a'
-        else:
-            first_rank += 'a'
-    first_base_10 = str_to_base_10(first_rank)
-    second_base_10 = str_to_base_10(second_rank)
-    if (second_base_10 - first_base_10) <= 1:
-        return first_rank + 'n'
-    middle = int((first_base_10 + second_base_10) // 2)
-    return to_base_26(middle)
+RANK_CHARS = string.ascii_lowercase
+RANK_DIGITS = str.maketrans(RANK_CHARS, string.digits + string.ascii_lowercase[:ALPHABET_SIZE - 10])
+RANK_PAIRS = [first + second for first in RANK_CHARS for second in RANK_CHARS]
 
 
-def get_default_ranks(length):
-    if length > 17576:
-        raise ValueError(f"Ranks can not be generated for more than 17,576 items! {length} supplied")
+def rank_to_int(rank, length):
+    """
+    Exact integer value of a rank right padded with 'a' to `length` characters ('a' = 0 ... 'z' = 25).
+    """
+    if not rank:
+        return 0
+    return int(rank.translate(RANK_DIGITS), ALPHABET_SIZE) * ALPHABET_SIZE ** (length - len(rank))
 
-    start_pos = 'aaa'
-    end_pos = 'zzz'
 
-    start_code = ord(start_pos[0])
-    end_code = ord(end_pos[0])
-    diff_in_one_symb = end_code - start_code
+def int_to_rank(value, length):
+    """
+    Inverse of rank_to_int, trailing 'a's are dropped as they do not change the position.
+    """
+    pairs = []
+    for __ in range(length // 2):
+        value, pair = divmod(value, ALPHABET_SIZE * ALPHABET_SIZE)
+        pairs.append(RANK_PAIRS[pair])
+    if length % 2:
+        pairs.append(RANK_CHARS[value % ALPHABET_SIZE])
+    return ''.join(reversed(pairs)).rstrip('a')
 
-    # x = a + b * size + c * size^2
-    total_diff = diff_in_one_symb + diff_in_one_symb * ALPHABET_SIZE + diff_in_one_symb * ALPHABET_SIZE * ALPHABET_SIZE
-    diff_for_one_item = total_diff // (length + 1)
 
-    # x = difference / size^(place - 1) % size
-    diff_for_symbols = [
-        diff_for_one_item % ALPHABET_SIZE,
-        diff_for_one_item // ALPHABET_SIZE % ALPHABET_SIZE,
-        diff_for_one_item // math.pow(ALPHABET_SIZE, 2) % ALPHABET_SIZE,
-    ]
+def get_ranks_between(first_rank='', second_rank=None, count=1):
+    """
+    Get `count` evenly spaced ranks between two ranks, using exact integer arithmetic.
 
-    positions = []
-    last_added_element = start_pos
+    Args:
+        first_rank (str): The lower bound, '' for the start of the list.
+        second_rank (str): The upper bound, None for the end of the list.
+        count (int): The number of ranks to generate.
 
-    for ind in range(length):
-        offset = 0
-        new_element = ''
-        for index in range(3):
-            diff_in_symbols = diff_for_symbols[index]
-            new_element_code = ord(last_added_element[2 - index]) + diff_in_symbols
-            if offset != 0:
-                new_element_code += 1
-                offset = 0
+    Returns:
+        List[str]: Ordered ranks, all strictly between the bounds.
+    """
+    if second_rank and not second_rank > first_rank:
+        raise ValueError(f"secondRank must be greater than firstRank! {second_rank} is not greater than {first_rank}")
+    length = max(len(first_rank), len(second_rank or ''), 1)
+    low = rank_to_int(first_rank, length)
+    high = rank_to_int(second_rank, length) if second_rank else ALPHABET_SIZE ** length
+    if high == low:
+        # e.g. 'b' and 'ba', only trailing 'a's apart
+        raise ValueError(f"There is no rank between {first_rank} and {second_rank}")
+    # add characters until there is room for `count` ranks
+    while high - low <= count:
+        length += 1
+        low *= ALPHABET_SIZE
+        high *= ALPHABET_SIZE
+    span = high - low
+    return [int_to_rank(low + span * i // (count + 1), length) for i in range(1, count + 1)]
 
-            if new_element_code > ord('z'):
-                offset += 1
-                new_element_code -= ALPHABET_SIZE
 
-            symbol = chr(int(new_element_code))
-            new_element += symbol
+def get_rank_between(first_rank, second_rank):
+    if not second_rank > first_rank:
+        raise ValueError(f"secondRank must be greater than firstRank! {second_rank} is not greater than {first_rank}")
+    return get_ranks_between(first_rank, second_rank)[0]
+
+
+@functools.lru_cache(maxsize=None)
+def _rank_triples():
+    return [first + pair for first in RANK_CHARS for pair in RANK_PAIRS]
+
+
+def default_rank_length(length):
+    """
+    Key length used by iter_default_ranks for `length` items.
+    """
+    key_length = 3
+    while ALPHABET_SIZE ** key_length - 1 <= length:
+        key_length += 1
+    return key_length
 
-        # reverse element since we calculated from the end
-        new_element = ''.join(reversed(list(new_element)))
-        positions.append(new_element)
-        last_added_element = new_element
 
-    positions.sort()
-    return positions
+def iter_default_ranks(length):
+    """
+    Lazily generate `length` ordered ranks evenly spread over the shortest key length that fits them.
+    Keys have at least 3 characters, so for up to 17,574 items they are the same as before.
+    """
+    key_length = default_rank_length(length)
+    step = (ALPHABET_SIZE ** key_length - 1) // (length + 1)
+
+    # keys are built from 3 character chunks, the most significant one may be shorter
+    triples = _rank_triples()
+    chunk = len(triples)
+    tail_chunks = (key_length - 1) // 3
+    head_length = key_length - 3 * tail_chunks
+    heads = triples if head_length == 3 else [triple[3 - head_length:] for triple in triples]
+
+    value = 0
+    if tail_chunks == 0:
+        for __ in range(length):
+            value += step
+            yield heads[value]
+    elif tail_chunks == 1:
+        for __ in range(length):
+            value += step
+            high, low = divmod(value, chunk)
+            yield heads[high] + triples[low]
+    else:
+        for __ in range(length):
+            value += step
+            remainder = value
+            parts = []
+            for ___ in range(tail_chunks):
+                remainder, low = divmod(remainder, chunk)
+                parts.append(triples[low])
+            parts.append(heads[remainder])
+            yield ''.join(reversed(parts))
+
+
+def get_default_ranks(length):
+    return list(iter_default_ranks(length))
 
 
 def json_loads(val):
@@ -200,22 +213,142 @@ def nl2br(s):
     return '<br />\n'.join(s.split('\n'))
 
 
-def get_flat_items(data, sub_key=''):
-    pairs = []
-    for key, val in data.items() if isinstance(data, dict) else enumerate(data):
-        new_key = sub_key + '_' + str(key) if sub_key else str(key)
-        if isinstance(val, (dict, list)):
-            try:
-                pairs = pairs + get_flat_items(val, new_key)
-            except RecursionError:
-                pairs.append((new_key, val))
+def iter_flat_items(data, separator='_', max_depth=None, prefix=''):
+    """
+    Lazily yield the (key, value) leaves of nested dicts and lists, keys joined with `separator`
+    (list items are keyed by their index). Empty containers yield nothing.
+
+    Args:
+        data (dict | list): The data to flatten.
+        separator (str): Joins the keys of the levels.
+        max_depth (int): Containers nested deeper than this are yielded as values (optional).
+        prefix (str): Prepended to all keys.
+
+    Yields:
+        tuple: (flat_key, value) pairs, depth first in the order of the data.
+    """
+    # one iterator per open level instead of recursion, containers already open are yielded as values
+    stack = [(_container_items(data), prefix)]
+    open_ids = [id(data)]
+    while stack:
+        items, sub_key = stack[-1]
+        try:
+            key, val = next(items)
+        except StopIteration:
+            stack.pop()
+            open_ids.pop()
+            continue
+        new_key = sub_key + separator + str(key) if sub_key else str(key)
+        if isinstance(val, (dict, list)) and (max_depth is None or len(stack) < max_depth) \
+                and id(val) not in open_ids:
+            stack.append((_container_items(val), new_key))
+            open_ids.append(id(val))
         else:
-            pairs.append((new_key, val))
-    return pairs
+            yield new_key, val
+
 
+def _container_items(data):
+    return iter(data.items()) if isinstance(data, dict) else enumerate(data)
+
+
+def get_flat_items(data, sub_key=''):
+    return list(iter_flat_items(data, prefix=sub_key))
 
-def flatten_dict(data):
-    return dict(get_flat_items(data))
+
+def flatten_dict(data, separator='_', max_depth=None):
+    return dict(iter_flat_items(data, separator, max_depth))
+
+
+class FlatView(Mapping):
+    """
+    Read only view resolving flat keys ('user_first_name') against the nested data on lookup,
+    so only the keys that are used get resolved. Iterating it walks the whole data like flatten_dict.
+
+    Keys and values are the same as flatten_dict's: when several paths flatten to the same key
+    ({'a_b': 1, 'a': {'b': 2}}) the one flatten_dict writes last wins and the key is listed once.
+    """
+
+    def __init__(self, data, separator='_', max_depth=None):
+        self.data = data
+        self.separator = separator
+        self.max_depth = max_depth
+
+    def __getitem__(self, flat_key):
+        matches = list(self._resolve(self.data, str(flat_key), 1, (id(self.data),)))
+        if not matches:
+            raise KeyError(flat_key)
+        if len(matches) == 1:
+            return matches[0][1]
+        # flatten_dict keeps the last write, i.e. the path walked last depth first
+        return max(matches, key=lambda match: self._walk_order(match[0]))[1]
+
+    def _resolve(self, data, flat_key, depth, open_ids):
+        # keys can contain the separator themselves, so every split is tried, yields (path, value)
+        split_at = len(flat_key)
+        while split_at > 0:
+            for key, val in _container_children(data, flat_key[:split_at]):
+                # same rules as iter_flat_items for what is opened and what is a value
+                is_container = isinstance(val, (dict, list)) and (self.max_depth is None or depth < self.max_depth) \
+                    and id(val) not in open_ids
+                if split_at == len(flat_key):
+                    if not is_container:
+                        yield (key,), val
+                elif is_container:
+                    rest = flat_key[split_at + len(self.separator):]
+                    for path, value in self._resolve(val, rest, depth + 1, open_ids + (id(val),)):
+                        yield (key,) + path, value
+            split_at = flat_key.rfind(self.separator, 0, split_at)
+
+    def _walk_order(self, path):
+        # position of each key of the path in its container, comparable like the depth first walk
+        order = []
+        data = self.data
+        for key in path:
+            order.append(key if isinstance(data, list) else list(data).index(key))
+            data = data[key]
+        return order
+
+    def __iter__(self):
+        seen = set()
+        for key, __ in iter_flat_items(self.data, self.separator, self.max_depth):
+            if key not in seen:
+                seen.add(key)
+                yield key
+
+    def __len__(self):
+        return len({key for key, __ in iter_flat_items(self.data, self.separator, self.max_depth)})
+
+
+def _container_children(data, key):
+    """ The (key, value) children of a dict or list whose key flattens to `key` """
+    # list indexes and non string keys are flattened with str()
+    index = int(key) if key.lstrip('-').isdigit() and str(int(key)) == key else None
+    if isinstance(data, list):
+        if index is not None and 0 <= index < len(data):
+            yield index, data[index]
+        return
+    if key in data:
+        yield key, data[key]
+    if index is not None and index in data:
+        yield index, data[index]
+
+
+PLACEHOLDER_RE = re.compile(r'\{([^{}]+)\}')
+
+
+def replace_placeholders(text, replacements):
+    """
+    Replace the {key} placeholders of a text with the string values of `replacements`
+    (a dict or FlatView), only the keys present in the text are looked up.
+    """
+    if not text:
+        return text
+
+    def replace(match):
+        value = replacements.get(match.group(1))
+        return value if isinstance(value, str) else match.group(0)
+
+    return PLACEHOLDER_RE.sub(replace, text)
 
 
 def format_price(price, currency='£'):
@@ -227,6 +360,7 @@ def format_price(price, currency='£'):
     return currency + ' ' + formatted_price if currency else formatted_price
 
 
+@functools.lru_cache(maxsize=None)
 def custom_permission_factory(permission_name):
     """
     Create a custom permission class that checks if the user has a specific permission.
@@ -235,7 +369,7 @@ def custom_permission_factory(permission_name):
         permission_name (str): The name of the permission to check.
 
     Returns:
-        permissions.BasePermission: A custom permission class instance.
+        permissions.BasePermission: A custom permission class, the same class for the same permission.
     """
 
     class CustomPermission(permissions.BasePermission):
@@ -282,28 +416,116 @@ def get_permission_classes(action, object_name, app_name=None):
     return [permission_class()]
 
 
-def sanitize_html(input_html):
-    # Define a whitelist of allowed tags and attributes
-    allowed_tags = [
-        'p', 'span', 'strong', 'em', 'u', 's', 'blockquote', 'ul', 'ol', 'li', 'a', 'img'
-    ]
-
-    allowed_attributes = {
-        'a': ['href', 'target', 'rel'],
-        'img': ['src', 'alt'],
-    }
+SANITIZE_TAGS = {'p', 'span', 'strong', 'em', 'u', 's', 'blockquote', 'ul', 'ol', 'li', 'a', 'img'}
+SANITIZE_ATTRIBUTES = {
+    'a': ['href', 'target', 'rel'],
+    'img': ['src', 'alt'],
+}
+# inputs longer than this are not memoized
+SANITIZE_CACHE_MAX_LENGTH = 64 * 1024
+
+_cleaners = threading.local()
+
+
+class LRUCache:
+    """
+    Small thread safe LRU mapping, bounded by the number of entries.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def keys(self):
+        with self._lock:
+            return list(self._data)
 
-    # Run bleach.clean with the defined whitelist
-    cleaned_html = bleach.clean(
-        input_html,
-        tags=set(allowed_tags),
-        attributes=allowed_attributes,
-        strip=True,
-    )
+    def __len__(self):
+        return len(self._data)
 
+
+_sanitized = LRUCache(settings.SANITIZE_HTML_CACHE_SIZE)
+
+
+def _get_cleaner():
+    # bleach Cleaners are not thread safe, keep one per thread
+    cleaner = getattr(_cleaners, 'cleaner', None)
+    if cleaner is None:
+        cleaner = _cleaners.cleaner = bleach.sanitizer.Cleaner(
+            tags=SANITIZE_TAGS, attributes=SANITIZE_ATTRIBUTES, strip=True)
+    return cleaner
+
+
+def sanitize_html(input_html):
+    """
+    Clean user HTML down to the allowed tags and attributes. Results are memoized by content hash.
+    """
+    if not isinstance(input_html, str) or len(input_html) > SANITIZE_CACHE_MAX_LENGTH:
+        return _get_cleaner().clean(input_html)
+    key = hashlib.blake2b(input_html.encode(), digest_size=16).digest()
+    cleaned_html = _sanitized.get(key)
+    if cleaned_html is None:
+        cleaned_html = _get_cleaner().clean(input_html)
+        _sanitized.set(key, cleaned_html)
     return cleaned_html
 
 
+def _sanitize_chunk(values):
+    return [sanitize_html(value) for value in values]
+
+
+def sanitize_html_many(values, workers=0, chunk_size=100):
+    """
+    Sanitize many HTML strings, e.g. the rich text fields of a bulk import.
+    Duplicates are cleaned once and None values are kept.
+
+    Args:
+        values (Iterable[str | None]): The HTML strings.
+        workers (int): Clean in a pool of this many processes (cleaning is pure Python and holds the GIL,
+            so threads would not help). Worth it for large imports only.
+        chunk_size (int): Strings per task sent to a worker process.
+
+    Returns:
+        List[str | None]: The cleaned strings, in the same order.
+    """
+    values = list(values)
+    unique = list(dict.fromkeys(value for value in values if value is not None))
+    if workers and workers > 1 and len(unique) > chunk_size:
+        chunks = [unique[start:start + chunk_size] for start in range(0, len(unique), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            cleaned = [html for chunk in executor.map(_sanitize_chunk, chunks) for html in chunk]
+    else:
+        cleaned = _sanitize_chunk(unique)
+    by_value = dict(zip(unique, cleaned))
+    return [by_value[value] if value is not None else None for value in values]
+
+
 def changed_fields(instance, validated_data):
     return [field for field, value in validated_data.items()
             if value != getattr(instance, field, None)
@@ -312,48 +534,16 @@ def changed_fields(instance, validated_data):
 
 
 def get_object_view_link(target_object, target_object_id, base_id=None):
-    multi_word_objects = {
-        'purchaseorder': 'purchase_order',
-        'jobhub': 'job_hub',
-        'jobitem': 'job_item',
-    }
-    obj = multi_word_objects[target_object] if target_object in multi_word_objects.keys() else target_object
-    base_link = settings.FRONTEND_APP_DIR + '/app/'
-    if obj == 'artwork':
-        link = base_link + 'artwork/artworks/' + str(target_object_id or '')
-    elif obj == 'artist':
-        link = base_link + 'artwork/artists/' + str(target_object_id or '')
-    elif obj == 'collection':
-        link = base_link + 'artwork/collections/' + str(target_object_id or '')
-    elif obj == 'collection_folder':
-        link = base_link + 'artwork/collections/folder/' + str(target_object_id or '')
-    elif obj == 'quotation':
-        link = base_link + 'job_hub/' + str(base_id or 0) + '/quotation/' + str(target_object_id or '')
-    elif obj == 'purchase_order':
-        link = base_link + 'job_hub/' + str(base_id or 0) + '/purchase_order/' + str(target_object_id or '')
-    elif obj == 'job_item':
-        link = base_link + 'job_hub/' + str(base_id or 0) + '/item/' + str(target_object_id or '')
-    elif obj == 'messaging':
-        link = base_link + 'messaging' + ('?c=' + str(target_object_id) if target_object_id else '')
-    else:
-        link = base_link + obj + '/' + str(target_object_id or '')
-
-    return link
+    return entity_routes.link(target_object, target_object_id, base_id)
 
 
 def media_url(media_path, frontend=False):
-    path = str(media_path).replace("\\", "/")
-    if not path:
-        return ''
-    if path.startswith('http'):
-        return path
-    if frontend:
-        parsed_url = urlparse(settings.FRONTEND_APP_DIR)
-        origin = f"{parsed_url.scheme}://{parsed_url.netloc}"
-        return urljoin(origin, path)
-    base = settings.STORAGE_URL
-    sas_token = settings.STORAGE_TOKEN
-    return '/'.join([base.rstrip('/'), path.lstrip('/')]) + sas_token
+    return get_media_url_builder().url(media_path, frontend)
+
+
+def media_urls(media_paths, frontend=False):
+    return get_media_url_builder().urls(media_paths, frontend)
+
 
 def random_string(length=16, charset=None):
     if charset is None:
@@ -0,0 +1,106 @@
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, close_old_connections
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+from core.fns import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+class LastSeenTracker:
+    """
+    Coalesces last_seen updates: a user is marked at most once per LAST_SEEN_INTERVAL seconds,
+    marks are kept in memory and written every LAST_SEEN_FLUSH_INTERVAL seconds as one UPDATE of last_seen only,
+    by a background thread of each process (started with the first mark), so requests never wait for it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        # last marks already written, users can come from the user cache with an older last_seen
+        self._marked = LRUCache(settings.USER_CACHE_SIZE)
+        self._stopped = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.requests = 0
+        self.flushes = 0
+        self.rows_written = 0
+
+    @property
+    def writes_avoided(self):
+        # every request used to save the user
+        return self.requests - self.rows_written - len(self._pending)
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'pending': len(self._pending),
+            'flushes': self.flushes,
+            'rows_written': self.rows_written,
+            'writes_avoided': self.writes_avoided,
+        }
+
+    def touch(self, user):
+        now = timezone.now()
+        with self._lock:
+            self.requests += 1
+            last_seen = self._pending.get(user.pk) or self._marked.get(user.pk) or user.last_seen
+            if not last_seen or (now - last_seen).total_seconds() >= settings.LAST_SEEN_INTERVAL:
+                self._pending[user.pk] = now
+                user.last_seen = now
+            self._start()
+
+    def _start(self):
+        # the thread doesn't survive a fork, each worker process starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='last-seen', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(settings.LAST_SEEN_FLUSH_INTERVAL):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Could not write last_seen marks')
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self._stopped.set()
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            get_user_model().objects.filter(pk__in=pending.keys()).update(last_seen=Case(
+                *[When(pk=pk, then=Value(last_seen)) for pk, last_seen in pending.items()],
+                output_field=DateTimeField(),
+            ))
+        except DatabaseError:
+            logger.exception('Could not write the last_seen of %s users, retrying with the next flush', len(pending))
+            with self._lock:
+                # marks made meanwhile are newer
+                self._pending = {**pending, **self._pending}
+            return 0
+        for pk, last_seen in pending.items():
+            self._marked.set(pk, last_seen)
+        with self._lock:
+            self.flushes += 1
+            self.rows_written += len(pending)
+        return len(pending)
+
+
+last_seen_tracker = LastSeenTracker()
+atexit.register(last_seen_tracker.stop)
@@ -0,0 +1,41 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from core.models import File, ImageFile, file_metadata
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Fill file_size, mime_type and content_hash for File and ImageFile rows uploaded before they were stored'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        for model in (File, ImageFile):
+            queryset = model.objects.exclude(Q(file='') | Q(file__isnull=True)).filter(
+                content_hash__isnull=True).order_by('id')
+            last_id = 0
+            processed = missing = 0
+            while True:
+                rows = list(queryset.filter(id__gt=last_id)[:options['batch_size']])
+                if not rows:
+                    break
+                updates = []
+                for row in rows:
+                    try:
+                        with row.file.open('rb'):
+                            row.file_size, row.mime_type, row.content_hash = file_metadata(row.file)
+                    except (FileNotFoundError, OSError) as e:
+                        missing += 1
+                        logger.warning('Could not read %s %s: %s', model._meta.model_name, row.pk, e)
+                        continue
+                    updates.append(row)
+                model.objects.bulk_update(updates, ['file_size', 'mime_type', 'content_hash'])
+                last_id = rows[-1].pk
+                processed += len(updates)
+                self.stdout.write(f'{model._meta.verbose_name}: {processed} updated, {missing} unreadable')
+        self.stdout.write(self.style.SUCCESS('Done'))
@@ -0,0 +1,94 @@
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from core.models import AppSettings, ImageFile
+from core.renditions import render_renditions
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_SETTING = 'thumbnail_backfill_id'
+
+
+def render_row(row):
+    pk, file_name, content_hash = row
+    try:
+        return pk, render_renditions(file_name, content_hash), None
+    except Exception as e:
+        return pk, None, str(e)
+
+
+class Command(BaseCommand):
+    help = ('Generate missing ImageFile thumbnails and renditions across a process pool. '
+            'Progress is stored as an id watermark so an interrupted run resumes where it stopped.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--stale', action='store_true',
+                            help='Also regenerate rows missing any of the declared renditions')
+        parser.add_argument('--after-id', type=int, default=None,
+                            help='Start after this id instead of the stored watermark')
+        parser.add_argument('--reset', action='store_true', help='Ignore the stored watermark and start over')
+        parser.add_argument('--limit', type=int, default=None, help='Stop after processing this many rows')
+
+    def get_queryset(self, stale):
+        queryset = ImageFile.objects.exclude(Q(file='') | Q(file__isnull=True))
+        condition = Q(thumbnail__isnull=True) | Q(thumbnail='')
+        if stale:
+            condition |= ~Q(renditions__has_keys=list(settings.IMAGE_RENDITIONS))
+        return queryset.filter(condition).order_by('id')
+
+    def handle(self, *args, **options):
+        if options['after_id'] is not None:
+            watermark = options['after_id']
+        elif options['reset']:
+            watermark = 0
+        else:
+            watermark = AppSettings.get_setting(WATERMARK_SETTING) or 0
+
+        queryset = self.get_queryset(options['stale'])
+        total = queryset.filter(id__gt=watermark).count()
+        if options['limit']:
+            total = min(total, options['limit'])
+        self.stdout.write(f'{total} images to process after id {watermark}')
+
+        processed = failed = missing = 0
+        started = time.monotonic()
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as executor:
+            while processed < total:
+                size = min(options['batch_size'], total - processed)
+                rows = list(queryset.filter(id__gt=watermark).values_list('id', 'file', 'content_hash')[:size])
+                if not rows:
+                    break
+
+                updates = []
+                chunksize = max(1, len(rows) // (options['workers'] * 4))
+                for pk, renditions, error in executor.map(render_row, rows, chunksize=chunksize):
+                    if error:
+                        failed += 1
+                        logger.warning('Thumbnail generation failed for image file %s: %s', pk, error)
+                    elif renditions is None:
+                        # the original is missing, the row is left empty to be rendered once it is restored
+                        missing += 1
+                    else:
+                        updates.append(ImageFile(pk=pk, thumbnail=renditions.get('thumb'), renditions=renditions))
+                ImageFile.objects.bulk_update(updates, ['thumbnail', 'renditions'])
+
+                watermark = rows[-1][0]
+                AppSettings.objects.update_or_create(name=WATERMARK_SETTING, defaults={'data': watermark})
+
+                processed += len(rows)
+                elapsed = time.monotonic() - started
+                rate = processed / elapsed if elapsed else 0
+                eta = (total - processed) / rate if rate else 0
+                self.stdout.write(f'{processed}/{total} processed, {failed} failed, {missing} missing, '
+                                  f'{rate:.1f} images/s, id {watermark}, eta {eta:.0f}s')
+
+        self.stdout.write(self.style.SUCCESS(f'Done: {processed} images processed, {failed} failed, {missing} missing'))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarks import compare_results, load_results, run_benchmarks, save_results
+
+
+class Command(BaseCommand):
+    help = ('Run the offline micro benchmarks of core.benchmarks. '
+            'With --compare and --threshold the command fails when a benchmark got slower, for use in CI.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('pattern', nargs='?', default=None, help='Only run benchmarks whose name contains this')
+        parser.add_argument('--min-time', type=float, default=0.2, help='Seconds to spend on each timing round')
+        parser.add_argument('--save', default=None, help='Write the results to this JSON file')
+        parser.add_argument('--compare', default=None, help='Compare with the results saved in this JSON file')
+        parser.add_argument('--threshold', type=float, default=None,
+                            help='Fail when a benchmark is more than this many percent slower than the baseline')
+
+    def handle(self, *args, **options):
+        if options['threshold'] is not None and not options['compare']:
+            raise CommandError('--threshold needs a baseline to --compare with')
+        baseline = load_results(options['compare']) if options['compare'] else {}
+
+        results = run_benchmarks(options['pattern'], options['min_time'])
+        changes = compare_results(baseline, results)
+        width = max((len(name) for name in results), default=0)
+        for name, result in results.items():
+            line = f"{name:<{width}}  {result['ops_per_sec']:>14,.0f} ops/s  {result['alloc_bytes']:>12,} B"
+            if name in changes:
+                line += f'  {changes[name]:>+8.1%}'
+            self.stdout.write(line)
+
+        if options['save']:
+            save_results(options['save'], results)
+
+        if options['threshold'] is not None:
+            regressions = [name for name, change in changes.items() if change < -options['threshold'] / 100]
+            if regressions:
+                raise CommandError(f"{len(regressions)} benchmarks regressed more than {options['threshold']}%: "
+                                   + ', '.join(regressions))
+            self.stdout.write(self.style.SUCCESS(f'No benchmark regressed more than {options["threshold"]}%'))
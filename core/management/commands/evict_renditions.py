@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.models import ImageFile
+from core.renditions import evict_renditions
+
+
+class Command(BaseCommand):
+    help = 'Delete the least recently used image renditions until the cache fits in IMAGE_RENDITIONS_MAX_BYTES'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-bytes', type=int, default=None,
+                            help='Cache size to shrink to (defaults to IMAGE_RENDITIONS_MAX_BYTES)')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        deleted = evict_renditions(options['max_bytes'])
+        deleted_set = set(deleted)
+
+        # drop the evicted paths from the rows so they get rendered again on demand
+        updated = 0
+        for name, spec in settings.IMAGE_RENDITIONS.items():
+            if spec.get('pinned'):
+                continue
+            for start in range(0, len(deleted), options['batch_size']):
+                chunk = deleted[start:start + options['batch_size']]
+                rows = list(ImageFile.objects.filter(**{f'renditions__{name}__in': chunk}).only('id', 'renditions'))
+                for row in rows:
+                    row.renditions = {k: v for k, v in row.renditions.items() if v not in deleted_set}
+                ImageFile.objects.bulk_update(rows, ['renditions'], batch_size=options['batch_size'])
+                updated += len(rows)
+
+        self.stdout.write(self.style.SUCCESS(f'Evicted {len(deleted)} renditions, updated {updated} images'))
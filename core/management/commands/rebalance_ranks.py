@@ -0,0 +1,44 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from core.ranking import RankRebalancer
+
+
+class Command(BaseCommand):
+    help = ('Give ordered lists compact ranks again once their keys grew too long. '
+            'Safe to run from cron while users reorder, busy rows are skipped until the next run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help='app_label.ModelName')
+        parser.add_argument('--field', default='rank', help='The rank field')
+        parser.add_argument('--group-by', default='', help='Comma separated fields identifying a list')
+        parser.add_argument('--slack', type=int, default=2,
+                            help='Rebalance when keys are on average this many characters longer than needed')
+        parser.add_argument('--max-length', type=int, default=None,
+                            help='Also rebalance lists with any key longer than this')
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=None, help='Rebalance at most this many lists')
+        parser.add_argument('--dry-run', action='store_true', help='Only report the lists needing a rebalance')
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options['model'])
+        except (LookupError, ValueError) as e:
+            raise CommandError(str(e))
+
+        rebalancer = RankRebalancer(
+            model, rank_field=options['field'], group_by=[field for field in options['group_by'].split(',') if field],
+            slack=options['slack'], max_length=options['max_length'], batch_size=options['batch_size'])
+
+        if options['dry_run']:
+            found = rebalancer.find_lists()[:options['limit']]
+            for group, stats in found:
+                self.stdout.write(f'{group or "all"}: {stats["items"]} items, '
+                                  f'longest key {stats["longest"]}, average {stats["average"]:.1f}')
+            self.stdout.write(self.style.SUCCESS(f'{len(found)} lists need a rebalance'))
+            return
+
+        results = rebalancer.run(limit=options['limit'])
+        for group, stats, result in results:
+            self.stdout.write(f'{group or "all"}: {result["updated"]} updated, {result["skipped"]} skipped')
+        self.stdout.write(self.style.SUCCESS(f'{len(results)} lists rebalanced'))
@@ -0,0 +1,68 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.models import ImageFile
+from core.renditions import rendition_url, scan_renditions
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the ImageFile rendition index (the renditions and thumbnail columns) from a scan of the '
+            'media directory, so serving never has to check the disk')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='Report the differences without saving them')
+
+    def scan_legacy_thumbnails(self):
+        root = os.path.join(settings.MEDIA_ROOT, settings.ENTITY_FILES_BASE)
+        found = set()
+        for directory, __, files in os.walk(root):
+            if os.path.basename(directory) != 'thumbnails':
+                continue
+            for file_name in files:
+                found.add(os.path.join(settings.MEDIA_URL, os.path.relpath(os.path.join(directory, file_name),
+                                                                          settings.MEDIA_ROOT)))
+        return found
+
+    def reconcile(self, file_name, content_hash, thumbnail, on_disk, legacy):
+        renditions = {}
+        for name, spec in settings.IMAGE_RENDITIONS.items():
+            # renditions rendered before the content hash was stored are keyed by the file name
+            for source_key in filter(None, (content_hash, file_name)):
+                url = rendition_url(name, source_key, spec)
+                if url in on_disk:
+                    renditions[name] = url
+                    break
+        if 'thumb' in renditions:
+            thumbnail = renditions['thumb']
+        elif not thumbnail or not (thumbnail in legacy or thumbnail.startswith('http')):
+            thumbnail = None
+        return thumbnail, renditions
+
+    def handle(self, *args, **options):
+        on_disk = scan_renditions()
+        legacy = self.scan_legacy_thumbnails()
+        self.stdout.write(f'Found {len(on_disk)} renditions and {len(legacy)} legacy thumbnails on disk')
+
+        queryset = ImageFile.objects.order_by('id').values_list('id', 'file', 'content_hash', 'thumbnail', 'renditions')
+        last_id = 0
+        checked = updated = 0
+        while True:
+            rows = list(queryset.filter(id__gt=last_id)[:options['batch_size']])
+            if not rows:
+                break
+            updates = []
+            for pk, file_name, content_hash, thumbnail, renditions in rows:
+                new_thumbnail, new_renditions = self.reconcile(file_name, content_hash, thumbnail, on_disk, legacy)
+                if new_thumbnail != thumbnail or new_renditions != renditions:
+                    updates.append(ImageFile(pk=pk, thumbnail=new_thumbnail, renditions=new_renditions))
+            if not options['dry_run']:
+                ImageFile.objects.bulk_update(updates, ['thumbnail', 'renditions'])
+            last_id = rows[-1][0]
+            checked += len(rows)
+            updated += len(updates)
+
+        action = 'would be updated' if options['dry_run'] else 'updated'
+        self.stdout.write(self.style.SUCCESS(f'{checked} images checked, {updated} {action}'))
@@ -0,0 +1,33 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from core.audit import async_audit_buffer, audit_buffer, get_audit_buffer
+
+
+class AuditBufferMiddleware:
+    """
+    Collect the log actions of a request and write them with one query at the end of it, or when their
+    transaction commits. The entries of a request whose view raised are dropped.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with audit_buffer():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        async with async_audit_buffer():
+            return await self.get_response(request)
+
+    def process_exception(self, request, exception):
+        # Django turns the exception into a response before it reaches __call__
+        buffer = get_audit_buffer()
+        if buffer is not None:
+            buffer.discard()
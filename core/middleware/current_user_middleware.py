@@ -0,0 +1,26 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from core.context import current_request
+
+
+class CurrentUserMiddleware:
+    """
+    Make the user of the request available through core.context.get_current_user.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with current_request(request):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with current_request(request):
+            return await self.get_response(request)
@@ -1,17 +1,32 @@
-from django.utils import timezone
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from core.last_seen import last_seen_tracker
 
 
 class UpdateLastSeenMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
         response = self.get_response(request)
+        self.touch(request)
+        return response
 
-        # Your logic to update last_seen field
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        # resolving a session user and flushing query the database
+        await sync_to_async(self.touch)(request)
+        return response
+
+    def touch(self, request):
+        # throttled and written in batches, see core.last_seen
         if request.user.is_authenticated:
             if hasattr(request.user, 'last_seen'):
-                request.user.last_seen = timezone.now()
-                request.user.save()
-
-        return response
+                last_seen_tracker.touch(request.user)
@@ -1,19 +1,24 @@
+import hashlib
+import mimetypes
 import os
 from uuid import uuid4
 
-from PIL import Image, ExifTags
+from PIL import Image
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.utils.encoding import force_str
-from django_currentuser.middleware import get_current_user
 from django.contrib.admin.models import LogEntry, ADDITION, CHANGE, DELETION
 from django.contrib.contenttypes.models import ContentType
 import json
 
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
 
-from core.fns import get_object_view_link
+from core.audit import get_audit_buffer
+from core.context import get_current_user
+from core.routes import entity_routes
+from core.thumbnails import get_thumbnail_path, thumbnail_pipeline, NO_IMAGE_URL, IMAGE_ERROR_URL
 
 Image.MAX_IMAGE_PIXELS = None  # Set to None to disable the limit
 
@@ -23,17 +28,21 @@ def entity_files_path(instance, filename):
     return os.path.join(settings.ENTITY_FILES_BASE, instance._meta.model_name, '{0}.{1}'.format(uuid4().hex, ext))
 
 
-def get_thumbnail_path(original_path):
-    # Split the original path into directory and filename
-    directory, filename = os.path.split(original_path)
-    thumbnails_dir = os.path.join(directory, 'thumbnails')
-    # Append '_thumb' to the filename before the extension
-    name, ext = os.path.splitext(filename)
-    new_filename = f"{name}_thumb{ext}"
+def blob_files_path(instance, filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return os.path.join(settings.ENTITY_FILES_BASE, 'blobs', instance.content_hash[:2], instance.content_hash + ext)
 
-    # Generate the new thumbnail path
-    thumbnail_path = os.path.join(thumbnails_dir, new_filename)
-    return thumbnail_path
+
+def file_metadata(file):
+    """
+    Read a file once in chunks and return its (size, mime type, sha256 hex digest).
+    """
+    size = 0
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        size += len(chunk)
+        digest.update(chunk)
+    return size, mimetypes.guess_type(file.name)[0], digest.hexdigest()
 
 
 class MetaFieldMixin(models.Model):
@@ -74,32 +83,25 @@ class MetaFieldMixin(models.Model):
 class EntityLinkMixin:
     @property
     def entity_model(self):
-        if not (hasattr(self, 'entity') and hasattr(self, 'content_type') and hasattr(self, 'object_id')):
+        # checked on the class, hasattr on the instance would load the entity
+        model = type(self)
+        if not (hasattr(model, 'entity') and hasattr(model, 'content_type') and hasattr(model, 'object_id')) \
+                or self.content_type_id is None:
             return ''
-        return self.content_type.model
+        # cached by ContentType, does not load the content_type of every row
+        return ContentType.objects.get_for_id(self.content_type_id).model
 
     @property
     def entity_type_name(self):
-        target_object = self.entity_model
-        multi_word_objects = {
-            'purchaseorder': 'Purchase Order',
-            'jobhub': 'Job Hub',
-            'jobitem': 'Job Item',
-        }
-        return multi_word_objects[
-            target_object] if target_object in multi_word_objects.keys() else target_object.capitalize()
+        return entity_routes.label(self.entity_model)
 
     @property
     def entity_link(self):
         target_object = self.entity_model
         if not target_object:
             return ''
-        base_id = None
-        if target_object in ['quotation', 'purchaseorder'] and self.entity.job_hub:
-            base_id = self.entity.job_hub.id
-        if target_object == 'jobitem':
-            base_id = self.entity.job.job_hub.id
-        return get_object_view_link(target_object, self.object_id, base_id)
+        # the entity is only loaded for routes with a base id
+        return entity_routes.instance_link(target_object, self.object_id, lambda: self.entity)
 
 
 class User(AbstractUser):
@@ -136,10 +138,18 @@ class EntityModel(models.Model):
     #                                null=True, blank=True, )
 
     def history(self):
-        return LogEntry.objects.filter(content_type_id=ContentType.objects.get_for_model(self).pk,
+        if hasattr(self, '_prefetched_history'):
+            # loaded in bulk by core.prefetch.prefetch_history
+            return self._prefetched_history
+        return LogEntry.objects.select_related('user').filter(content_type_id=ContentType.objects.get_for_model(self).pk,
                                        object_id=self.pk, action_time__gte=self.created_at).order_by('-action_time')
 
     def log_action(self, user, action, msg, **kwargs):
+        """
+        Record a LogEntry for this object. Inside core.audit.audit_buffer (every request, see AuditBufferMiddleware)
+        the entry is returned unsaved and written in bulk: when the surrounding atomic block commits (never if it
+        rolls back), else at the end of the request unless the request raised.
+        """
         change_fields = kwargs.get('changed_fields', [])
         if 'changed_fields' in kwargs:
             del kwargs['changed_fields']
@@ -153,14 +163,25 @@ class EntityModel(models.Model):
             message['changed'] = {'fields': change_fields}
         if action == DELETION:
             message['deleted'] = {}
-        return LogEntry.objects.log_action(
+        buffer = get_audit_buffer()
+        if buffer is None:
+            return LogEntry.objects.log_action(
+                user_id=user,
+                content_type_id=ContentType.objects.get_for_model(self).pk,
+                object_id=self.pk,
+                object_repr=force_str(self),
+                change_message=json.dumps(message),
+                action_flag=action
+            )
+        # the message is serialized when the buffer is written
+        return buffer.add(LogEntry(
             user_id=user,
             content_type_id=ContentType.objects.get_for_model(self).pk,
-            object_id=self.pk,
-            object_repr=force_str(self),
-            change_message=json.dumps(message),
+            object_id=str(self.pk),
+            object_repr=force_str(self)[:200],
+            change_message=message,
             action_flag=action
-        )
+        ))
 
     def save(self, *args, **kwargs):
         if not self.created_by:
@@ -219,12 +240,67 @@ class AppSettings(models.Model):
         ordering = ['name']
 
 
+class Blob(models.Model):
+    """
+    Content addressed storage shared by every file row with the same content.
+    The stored file is removed (by django_cleanup) together with the row once the last reference is released.
+    """
+    content_hash = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to=blob_files_path, max_length=255)
+    size = models.PositiveBigIntegerField(default=0)
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.content_hash
+
+    @staticmethod
+    def acquire(file, content_hash, size):
+        """
+        Return the blob holding this content, storing the file if it is new, and add a reference to it.
+        """
+        with transaction.atomic():
+            blob = Blob.objects.select_for_update().filter(content_hash=content_hash).first()
+            if blob is None:
+                blob = Blob(content_hash=content_hash, size=size)
+                blob.file.save(os.path.basename(file.name), file.file, save=False)
+                try:
+                    with transaction.atomic():
+                        blob.save()
+                except IntegrityError:
+                    # the same content was stored concurrently by another upload
+                    blob.file.delete(save=False)
+                    blob = Blob.objects.select_for_update().get(content_hash=content_hash)
+            Blob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+        return blob
+
+    @staticmethod
+    def release(blob_id):
+        """
+        Drop a reference, deleting the blob when it was the last one.
+        """
+        with transaction.atomic():
+            Blob.objects.filter(pk=blob_id).update(ref_count=F('ref_count') - 1)
+            for blob in Blob.objects.filter(pk=blob_id, ref_count__lte=0):
+                blob.delete()
+
+
 class BaseFile(EntityModel):
+    """
+    Uploaded files are deduplicated: rows with identical content share one Blob.
+    django_cleanup is disabled for subclasses (see core.signals), files are released through Blob.release instead.
+    """
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
     entity = GenericForeignKey('content_type', 'object_id')
     file = models.FileField('File', upload_to=entity_files_path, null=True, blank=True, max_length=255)
     file_name = models.CharField('File Name', max_length=255, blank=True, null=True)
+    file_size = models.PositiveBigIntegerField('File Size', null=True, blank=True, editable=False)
+    mime_type = models.CharField('MIME Type', max_length=127, null=True, blank=True, editable=False)
+    content_hash = models.CharField('Content Hash', max_length=64, null=True, blank=True, editable=False,
+                                    db_index=True)
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, related_name='+', null=True, blank=True,
+                             editable=False)
 
     @property
     def name(self):
@@ -233,6 +309,60 @@ class BaseFile(EntityModel):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if not self.file:
+            return self._save_cleared(*args, **kwargs)
+        if self.file._committed:
+            return super().save(*args, **kwargs)
+
+        # capture the file metadata once at upload so serializers never stat the storage
+        upload = self.file.file
+        if getattr(upload, 'content_hash', None):
+            # already hashed while it was received (core.uploads)
+            self.file_size, self.mime_type, self.content_hash = \
+                upload.size, mimetypes.guess_type(self.file.name)[0], upload.content_hash
+        else:
+            self.file_size, self.mime_type, self.content_hash = file_metadata(self.file)
+
+        with transaction.atomic():
+            previous = type(self).objects.filter(pk=self.pk).values_list('blob_id', 'file').first() \
+                if self.pk else None
+            # identical content is stored once, the row points at the shared blob file
+            if not self.file_name:
+                self.file_name = os.path.basename(self.file.name)
+            self.blob = Blob.acquire(self.file, self.content_hash, self.file_size)
+            self.file.name = self.blob.file.name
+            self.file._committed = True
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'file', 'file_name', 'blob', 'file_size',
+                                           'mime_type', 'content_hash'}
+            super().save(*args, **kwargs)
+            if previous:
+                self.release_file(*previous)
+
+    def _save_cleared(self, *args, **kwargs):
+        # the file was removed, the blob (or the file of an older upload) it pointed at is released
+        with transaction.atomic():
+            previous = type(self).objects.filter(pk=self.pk).values_list('blob_id', 'file').first() \
+                if self.pk else None
+            if previous and (previous[0] or previous[1]):
+                self.blob = None
+                if kwargs.get('update_fields') is not None:
+                    kwargs['update_fields'] = {*kwargs['update_fields'], 'blob'}
+            else:
+                previous = None
+            super().save(*args, **kwargs)
+            if previous:
+                self.release_file(*previous)
+
+    def release_file(self, blob_id, file_name):
+        if blob_id:
+            Blob.release(blob_id)
+        elif file_name:
+            # uploaded before blobs existed, the file is not shared
+            storage = self.file.storage
+            transaction.on_commit(lambda: storage.delete(file_name))
+
     def has_file(self):
         return bool(self.file)
 
@@ -257,56 +387,46 @@ class ImageFile(BaseFile):
     file = models.ImageField('Image', upload_to=entity_files_path, height_field='img_height', width_field='img_width',
                              null=True, blank=True, max_length=255)
     thumbnail = models.CharField(max_length=255, null=True, blank=True)
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
 
     def get_thumbnail_path(self):
         return get_thumbnail_path(self.file.name)
 
     def img_thumbnail(self):
+        """
+        Return the thumbnail path without rendering it in the request.
+        Missing thumbnails are queued for the background pipeline and a placeholder is returned meanwhile.
+        """
         if self.thumbnail:
+            thumbnail_pipeline.record_access(self.thumbnail)
             return self.thumbnail
-        if not self.file or not os.path.exists(os.path.join(settings.MEDIA_ROOT, self.file.name)):
-            return 'https://dummyimage.com/150/bbbbbb/eeeeee&text=No+Image'
-
-        thumbnail_path = self.get_thumbnail_path()
-        if os.path.exists(os.path.join(settings.MEDIA_ROOT, thumbnail_path)):
-            thumbnail = os.path.join(settings.MEDIA_URL, thumbnail_path)
-            self.thumbnail = thumbnail
-            self.save(update_fields=['thumbnail'])
-            return thumbnail
-
-        thumbnail_size = (200, 200)
-
-        try:
-            image_path = os.path.join(settings.MEDIA_ROOT, self.file.name)
-
-            # Open the image and preserve the original EXIF metadata
-            with Image.open(image_path) as image:
-                if hasattr(image, '_getexif'):  # Check if the image has EXIF data
-                    exif = image._getexif()
-                    if exif is not None:
-                        for key, value in exif.items():
-                            tag = ExifTags.TAGS.get(key)
-                            if tag == 'Orientation':
-                                if value == 3:
-                                    image = image.rotate(180, expand=True)
-                                elif value == 6:
-                                    image = image.rotate(270, expand=True)
-                                elif value == 8:
-                                    image = image.rotate(90, expand=True)
-
-                image.thumbnail(thumbnail_size, Image.BICUBIC)
-
-                # Save the thumbnail
-                os.makedirs(os.path.join(settings.MEDIA_ROOT, os.path.dirname(thumbnail_path)), exist_ok=True)
-                image.save(os.path.join(settings.MEDIA_ROOT, thumbnail_path), quality=100)
-
-                thumbnail = os.path.join(settings.MEDIA_URL, thumbnail_path)
-                self.thumbnail = thumbnail
-                self.save(update_fields=['thumbnail'])
-                return thumbnail
-        except Exception as e:
-            print(e)
-            return 'https://dummyimage.com/150/bbbbbb/eeeeee&text=Image+Error'
+        return self.rendition('thumb')
+
+    def rendition(self, name):
+        """
+        Return the path of a declared rendition (settings.IMAGE_RENDITIONS), queueing it if not rendered yet.
+        """
+        if name in self.renditions:
+            thumbnail_pipeline.record_access(self.renditions[name])
+            return self.renditions[name]
+        if not self.file:
+            return NO_IMAGE_URL
+        failure = thumbnail_pipeline.get_failure(self.pk)
+        if failure:
+            return NO_IMAGE_URL if failure == 'missing' else IMAGE_ERROR_URL
+        thumbnail_pipeline.enqueue(self)
+        return settings.THUMBNAIL_PLACEHOLDER_URL
+
+    def save(self, *args, **kwargs):
+        new_upload = bool(self.file) and not self.file._committed
+        if new_upload:
+            self.thumbnail = None
+            self.renditions = {}
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'thumbnail', 'renditions'}
+        super().save(*args, **kwargs)
+        if new_upload:
+            transaction.on_commit(lambda: thumbnail_pipeline.enqueue(self))
 
     class Meta:
         ordering = ['-id']
@@ -0,0 +1,313 @@
+import base64
+import datetime
+import json
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination, _positive_int
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class ListLimitOffsetPagination(LimitOffsetPagination):
+    """
+    LimitOffsetPagination with a default page size of settings.LIST_PER_PAGE,
+    and an async variant of paginate_queryset for async views.
+    """
+
+    def get_limit(self, request):
+        return super().get_limit(request) or settings.LIST_PER_PAGE
+
+    async def apaginate_queryset(self, queryset, request):
+        if not isinstance(request, Request):
+            request = Request(request)
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.offset = self.get_offset(request)
+        self.count = await queryset.acount()
+        if self.count == 0 or self.offset > self.count:
+            return []
+        return [row async for row in queryset[self.offset:self.offset + self.limit]]
+
+
+def estimate_count(queryset):
+    """
+    Row count of a queryset estimated by PostgreSQL, without scanning the rows: the table statistics
+    (pg_class.reltuples) for a whole table, the planner estimate (EXPLAIN) for a filtered queryset.
+
+    Returns:
+        int: The estimate, or None on other databases and for tables never analyzed.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    query = queryset.query
+    whole_table = not query.where and not query.distinct and query.group_by is None and not query.combinator \
+        and not query.low_mark and query.high_mark is None
+    with connection.cursor() as cursor:
+        if whole_table:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                           [connection.ops.quote_name(queryset.model._meta.db_table)])
+            row = cursor.fetchone()
+            estimate = row[0] if row else -1
+        else:
+            sql, params = queryset.order_by().query.sql_with_params()
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            estimate = plan[0]['Plan']['Plan Rows']
+    # reltuples is -1 (0 before PostgreSQL 14) until the table is first vacuumed or analyzed
+    return int(estimate) if estimate > 0 else None
+
+
+def _cursor_value(value):
+    # full precision, DjangoJSONEncoder truncates datetimes to milliseconds
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def _lookup_field(model, name):
+    field = None
+    for part in name.split('__'):
+        field = model._meta.pk if part == 'pk' else model._meta.get_field(part)
+        model = field.related_model
+    return field
+
+
+def _lookup_value(instance, name):
+    for part in name.split('__'):
+        instance = getattr(instance, part)
+    return instance
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset pagination: a page is read from the ordering values of the last row of the previous page
+    (WHERE (action_time, id) < (...)) instead of an OFFSET, so deep pages cost as much as the first one
+    and rows inserted meanwhile don't shift the pages. The ordering must be unique (end with the primary key)
+    and its fields not nullable.
+
+    The cursor query parameter is an opaque token of these values and the direction, given in the
+    `next` and `previous` links.
+    """
+    ordering = ('-id',)
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    max_page_size = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.fields = [(name.lstrip('-'), name.startswith('-')) for name in self.get_ordering(queryset, view)]
+        position, reverse = self.decode_cursor(request, queryset.model)
+        return self.paginate_keyset(queryset, position, reverse)
+
+    def paginate_keyset(self, queryset, position=None, reverse=False, offset=0):
+        # a previous page is read backwards from the first row of the current one
+        queryset = queryset.order_by(*[('' if descending == reverse else '-') + name
+                                       for name, descending in self.fields])
+        if position is not None:
+            queryset = queryset.filter(self.after_position(position, reverse))
+        page = list(queryset[offset:offset + self.page_size + 1])
+        has_more = len(page) > self.page_size
+        page = page[:self.page_size]
+        if reverse:
+            page.reverse()
+        has_next = has_more if not reverse else position is not None
+        has_previous = has_more if reverse else position is not None or offset > 0
+        self.next_position = self.get_position(page[-1]) if has_next and page else None
+        self.previous_position = self.get_position(page[0]) if has_previous and page else None
+        return page
+
+    def get_ordering(self, queryset, view):
+        return self.ordering
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(request.query_params[self.page_size_query_param], cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return settings.LIST_PER_PAGE
+
+    def get_position(self, instance):
+        return [_lookup_value(instance, name) for name, _ in self.fields]
+
+    def after_position(self, position, reverse=False):
+        # (a, b) < (x, y) is a < x OR (a = x AND b < y), with < or > per field direction
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self.fields, position):
+            condition |= equal & Q(**{f"{name}__{'lt' if descending != reverse else 'gt'}": value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def encode_cursor(self, position, reverse=False):
+        data = json.dumps([int(reverse), *position], default=_cursor_value, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    def decode_cursor(self, request, model):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            if not isinstance(values, list) or len(values) != len(self.fields) + 1:
+                raise ValueError
+            reverse, *values = values
+            position = [_lookup_field(model, name).to_python(value) for (name, _), value in zip(self.fields, values)]
+            return position, bool(reverse)
+        except (TypeError, ValueError, ValidationError, FieldDoesNotExist):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_cursor_link(self, position, reverse=False):
+        if position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'offset')
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position, reverse))
+
+    def get_next_link(self):
+        return self.get_cursor_link(self.next_position)
+
+    def get_previous_link(self):
+        return self.get_cursor_link(self.previous_position, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class LogEntryPagination(KeysetPagination):
+    ordering = ('-action_time', '-id')
+
+
+class ListPagination(KeysetPagination):
+    """
+    The default pagination of the API, used with ?limit= (the response is the LimitOffsetPagination one):
+
+    - pages are keyset pages over the ordering of the list (OrderingFilter, else the model Meta.ordering,
+      else -pk), made unique with the primary key. The next and previous links carry a cursor.
+    - ?offset= is still accepted for older clients, it scans the skipped rows, then the links carry cursors.
+      Lists ordered on nullable fields or expressions, which keyset pages can't follow, keep offset links.
+    - the count is only given on pages reached without a cursor, as PAGINATION_COUNT sets (or the
+      `pagination_count` attribute of the view): 'exact' (COUNT(*)), 'estimate' (from the PostgreSQL statistics,
+      exact below PAGINATION_EXACT_COUNT_BELOW rows) or None (no count).
+
+    Without ?limit, ?cursor or ?offset the list is not paginated, as with LimitOffsetPagination without PAGE_SIZE.
+    """
+    offset_query_param = 'offset'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if not any(param in params for param in
+                   (self.page_size_query_param, self.cursor_query_param, self.offset_query_param)):
+            return None
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        ordering = self.get_ordering(queryset, view)
+        self.keyset = ordering is not None
+        self.fields = [(name.lstrip('-'), name.startswith('-')) for name in ordering or ()]
+        self.offset = self.get_offset(request)
+
+        position, reverse = self.decode_cursor(request, queryset.model) if self.keyset else (None, False)
+        self.count = None
+        self.count_estimated = False
+        if position is None:
+            self.count, self.count_estimated = self.get_count(queryset, view)
+
+        if self.keyset:
+            return self.paginate_keyset(queryset, position, reverse, self.offset if position is None else 0)
+        page = list(queryset[self.offset:self.offset + self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        return page[:self.page_size]
+
+    def get_offset(self, request):
+        try:
+            return _positive_int(request.query_params[self.offset_query_param])
+        except (KeyError, ValueError):
+            return 0
+
+    def get_ordering(self, queryset, view):
+        """
+        The keyset ordering of a queryset, or None when its rows can't be paged by keyset.
+        """
+        meta = queryset.model._meta
+        ordering = list(queryset.query.order_by or (meta.ordering if queryset.query.default_ordering else ()))
+        if not all(isinstance(name, str) and name.lstrip('-') and name != '?' for name in ordering):
+            return None
+        try:
+            fields = [_lookup_field(queryset.model, name.lstrip('-')) for name in ordering]
+        except FieldDoesNotExist:
+            return None
+        if any(field.null or field.is_relation for field in fields):
+            return None
+        if not fields or fields[-1] != meta.pk:
+            ordering.append(('-' if ordering and ordering[-1].startswith('-') else '') + meta.pk.name)
+        return ordering
+
+    def get_count(self, queryset, view):
+        """
+        Returns:
+            tuple: (count, estimated), count being None when disabled.
+        """
+        mode = getattr(view, 'pagination_count', settings.PAGINATION_COUNT)
+        if mode is None:
+            return None, False
+        if mode == 'estimate':
+            estimate = estimate_count(queryset)
+            if estimate is not None and estimate >= settings.PAGINATION_EXACT_COUNT_BELOW:
+                return estimate, True
+        return queryset.count(), False
+
+    def get_next_link(self):
+        if self.keyset:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.offset_query_param,
+                                   self.offset + self.page_size)
+
+    def get_previous_link(self):
+        if self.keyset:
+            return super().get_previous_link()
+        if self.offset <= 0:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.offset_query_param,
+                                   max(self.offset - self.page_size, 0))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'count_estimated': self.count_estimated,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties'].update({
+            'count': {'type': 'integer', 'nullable': True},
+            'count_estimated': {'type': 'boolean'},
+        })
+        return response_schema
@@ -0,0 +1,156 @@
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import F, Value
+from django.db.models.functions import Concat
+
+VERSION_CACHE_KEY = 'permissions_version'
+
+
+def _new_version(cache_key):
+    # a new random stamp, so entries cached under an evicted version are never read again
+    version = uuid.uuid4().hex[:12]
+    cache.set(cache_key, version, None)
+    return version
+
+
+def check_shared_cache():
+    """
+    Permissions reused across requests (cache or token claims) and cached users are invalidated through the
+    default cache, which must be shared by all the processes: a change handled by one process must reach the
+    others, or they keep accepting stale permissions, deactivated users or changed passwords until these expire.
+    """
+    enabled = [name for name in ('JWT_PERMISSION_CLAIMS', 'PERMISSION_CACHE_TIMEOUT', 'USER_CACHE_TIMEOUT')
+               if getattr(settings, name)]
+    if enabled and isinstance(caches['default'], (LocMemCache, DummyCache)):
+        verb = 'needs' if len(enabled) == 1 else 'need'
+        raise ImproperlyConfigured(f"{' and '.join(enabled)} {verb} a default cache shared by the processes "
+                                   f"(memcached, redis or the database), not a local memory cache.")
+
+
+def permissions_version(user_id):
+    """
+    Version stamp of the groups and permissions of a user. It changes when the groups or permissions
+    of the user change, and when any group or permission changes. The stamps are kept in the default cache,
+    shared by the processes (see check_shared_cache).
+    """
+    keys = [VERSION_CACHE_KEY, f'{VERSION_CACHE_KEY}:{user_id}']
+    versions = cache.get_many(keys)
+    return '.'.join(versions.get(key) or _new_version(key) for key in keys)
+
+
+def bump_permissions_version(**kwargs):
+    _new_version(VERSION_CACHE_KEY)
+
+
+def bump_user_permissions_version(instance, reverse, **kwargs):
+    # user.groups / user.user_permissions changes only concern that user
+    if reverse:
+        bump_permissions_version()
+    else:
+        _new_version(f'{VERSION_CACHE_KEY}:{instance.pk}')
+
+
+def load_permission_snapshot(user):
+    """
+    Groups, user permissions and group permissions of a user, in one UNION query.
+    """
+    groups = Group.objects.filter(user=user).annotate(kind=Value('group'), value=F('name'))
+    user_permissions = Permission.objects.filter(user=user).annotate(
+        kind=Value('user'), value=Concat('content_type__app_label', Value('.'), 'codename'))
+    group_permissions = Permission.objects.filter(group__user=user).annotate(
+        kind=Value('group_permission'), value=Concat('content_type__app_label', Value('.'), 'codename'))
+    snapshot = {'group': [], 'user': [], 'group_permission': []}
+    parts = [queryset.order_by().values_list('kind', 'value')
+             for queryset in (groups, user_permissions, group_permissions)]
+    for kind, value in parts[0].union(*parts[1:], all=True):
+        snapshot[kind].append(value)
+    return snapshot
+
+
+def get_permission_snapshot(user):
+    """
+    The groups and permissions of a user, loaded once per user instance (so once per request) and,
+    with settings.PERMISSION_CACHE_TIMEOUT set, shared across requests through the cache until a group or
+    permission changes. The cross request cache needs a cache shared by all processes (not the default LocMemCache).
+    """
+    snapshot = getattr(user, '_permission_snapshot', None)
+    if snapshot is not None:
+        return snapshot
+    timeout = settings.PERMISSION_CACHE_TIMEOUT
+    if timeout:
+        cache_key = f'permissions:{user.pk}:{permissions_version(user.pk)}'
+        snapshot = cache.get(cache_key)
+        if snapshot is None:
+            snapshot = load_permission_snapshot(user)
+            cache.set(cache_key, snapshot, timeout)
+    else:
+        snapshot = load_permission_snapshot(user)
+    prime_permission_caches(user, snapshot)
+    return snapshot
+
+
+def prime_permission_caches(user, snapshot):
+    """
+    Fill the caches ModelBackend reads, so has_perm makes no queries.
+    """
+    user._permission_snapshot = snapshot
+    user._user_perm_cache = set(snapshot['user'])
+    user._group_perm_cache = set(snapshot['group_permission'])
+    user._perm_cache = user._user_perm_cache | user._group_perm_cache
+
+
+def permission_claims(user):
+    """
+    Token claims carrying the groups and permissions of a user, with their version stamp.
+    """
+    # the stamp is read first, a change while loading leaves the claims stale rather than wrong
+    version = permissions_version(user.pk)
+    snapshot = get_permission_snapshot(user)
+    return {
+        'groups': snapshot['group'],
+        'perms': snapshot['user'],
+        'group_perms': snapshot['group_permission'],
+        'pv': version,
+    }
+
+
+def prime_from_claims(user, token):
+    """
+    Prime the permission caches of a user from the claims of a token, unless they are stale.
+
+    Returns:
+        bool: Whether the claims were used.
+    """
+    if 'pv' not in token or token['pv'] != permissions_version(user.pk):
+        return False
+    prime_permission_caches(user, {
+        'group': token.get('groups', []),
+        'user': token.get('perms', []),
+        'group_permission': token.get('group_perms', []),
+    })
+    return True
+
+
+def user_groups(user):
+    if not user or not user.is_authenticated:
+        return []
+    return get_permission_snapshot(user)['group']
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend loading the permissions of a user with their groups, through get_permission_snapshot.
+    """
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if user_obj.is_active and not user_obj.is_anonymous and obj is None and not user_obj.is_superuser \
+                and not hasattr(user_obj, '_perm_cache'):
+            get_permission_snapshot(user_obj)
+        return super().get_all_permissions(user_obj, obj)
@@ -0,0 +1,89 @@
+from collections import defaultdict
+
+from django.contrib.admin.models import LogEntry
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from core.routes import entity_routes
+
+
+def prefetch_history(instances, limit=None):
+    """
+    Load the LogEntry history (with users) of many EntityModel instances in one query
+    and cache it on each instance, EntityModel.history() then returns the cached rows.
+
+    Args:
+        instances (Iterable[EntityModel]): The instances to load history for.
+        limit (int): Keep only the latest `limit` entries per instance (optional).
+
+    Returns:
+        list: The instances.
+    """
+    instances = [instance for instance in instances if instance.pk is not None]
+    if not instances:
+        return instances
+
+    by_key = {}
+    condition = Q()
+    for instance in instances:
+        content_type_id = ContentType.objects.get_for_model(instance).pk
+        by_key[(content_type_id, str(instance.pk))] = instance
+        # entries older than the instance belong to a deleted object with the same pk, they are filtered out
+        # before the per object limit applies
+        entry_condition = Q(content_type_id=content_type_id, object_id=str(instance.pk))
+        if instance.created_at is not None:
+            entry_condition &= Q(action_time__gte=instance.created_at)
+        condition |= entry_condition
+    queryset = LogEntry.objects.select_related('user').filter(condition).order_by('-action_time')
+    if limit:
+        queryset = queryset.annotate(row_number=Window(
+            RowNumber(), partition_by=[F('content_type_id'), F('object_id')], order_by=F('action_time').desc(),
+        )).filter(row_number__lte=limit)
+
+    history = defaultdict(list)
+    for entry in queryset:
+        history[by_key[(entry.content_type_id, entry.object_id)]].append(entry)
+    for instance in instances:
+        instance._prefetched_history = history[instance]
+    return instances
+
+
+def prefetch_entities(instances, field_name='entity'):
+    """
+    Load the generic relation targets of many rows (Note, File, ImageFile ...) with one query per content type,
+    together with the related objects their entity_link needs (the `related` of their route), and cache them
+    on the rows. Reading `instance.entity` and `entity_link` then makes no queries.
+    Django's prefetch_related('entity') also groups by content type, but can not select_related per type.
+
+    Args:
+        instances (Iterable[Model]): Rows with a GenericForeignKey.
+        field_name (str): The name of the GenericForeignKey.
+
+    Returns:
+        list: The instances.
+    """
+    instances = list(instances)
+    rows_by_content_type = defaultdict(list)
+    for instance in instances:
+        field = instance._meta.get_field(field_name)
+        content_type_id = getattr(instance, instance._meta.get_field(field.ct_field).attname)
+        object_id = getattr(instance, field.fk_field)
+        if content_type_id is not None and object_id is not None:
+            rows_by_content_type[content_type_id].append((instance, field, object_id))
+
+    for content_type_id, rows in rows_by_content_type.items():
+        content_type = ContentType.objects.get_for_id(content_type_id)
+        model = content_type.model_class()
+        if model is None:
+            continue
+        queryset = model._base_manager.filter(pk__in={object_id for __, __, object_id in rows})
+        route = entity_routes.get(content_type.model)
+        if route and route.related:
+            queryset = queryset.select_related(*route.related)
+        objects = queryset.in_bulk()
+        for instance, field, object_id in rows:
+            instance._meta.get_field(field.ct_field).set_cached_value(instance, content_type)
+            # deleted targets are cached as None too
+            field.set_cached_value(instance, objects.get(model._meta.pk.to_python(object_id)))
+    return instances
@@ -0,0 +1,155 @@
+import logging
+from bisect import bisect_left, bisect_right
+
+from django.db import transaction
+from django.db.models import Avg, Count, Max, Q, QuerySet
+from django.db.models.functions import Length
+
+from core.fns import default_rank_length, iter_default_ranks
+
+logger = logging.getLogger(__name__)
+
+
+class RankRebalancer:
+    """
+    Gives ordered lists their compact, evenly spaced ranks back once repeated inserts between
+    neighbours (get_rank_between) made the keys long.
+
+    A list is the set of rows sharing the `group_by` values, ordered by `rank_field`.
+    Rows are moved to their final key in small batches, each in its own short transaction, and a row is
+    only moved when its new key still sorts between its neighbours, as read again in that transaction, so the
+    order is valid after every batch even with rows inserted meanwhile.
+    Each batch locks the rows between its lowest and highest keys and the neighbours just outside them,
+    waiting for concurrent reorders of those rows to commit. Rows changed by them are left alone and picked
+    up next run.
+    """
+
+    def __init__(self, queryset, rank_field='rank', group_by=(), slack=2, max_length=None, batch_size=200):
+        self.queryset = queryset if isinstance(queryset, QuerySet) else queryset._default_manager.all()
+        self.model = self.queryset.model
+        self.rank_field = rank_field
+        self.group_by = list(group_by)
+        self.slack = slack
+        self.max_length = max_length
+        self.batch_size = batch_size
+
+    def needs_rebalance(self, items, longest, average):
+        """
+        A list is rebalanced when a key passes `max_length`, or when the keys are on average
+        more than `slack` characters longer than freshly generated ranks would be.
+        """
+        if not items:
+            return False
+        if self.max_length and longest > self.max_length:
+            return True
+        return average > default_rank_length(items) + self.slack
+
+    def list_stats(self):
+        aggregates = {
+            'items': Count('pk'),
+            'longest': Max(Length(self.rank_field)),
+            'average': Avg(Length(self.rank_field)),
+        }
+        queryset = self.queryset.order_by()
+        if not self.group_by:
+            return [{**queryset.aggregate(**aggregates)}]
+        return list(queryset.values(*self.group_by).annotate(**aggregates))
+
+    def find_lists(self):
+        """
+        Returns:
+            list: (group, stats) for each list needing a rebalance, group being the group_by field values.
+        """
+        found = []
+        for row in self.list_stats():
+            stats = {key: row.pop(key) for key in ('items', 'longest', 'average')}
+            if self.needs_rebalance(**stats):
+                found.append((row, stats))
+        return found
+
+    def rebalance(self, group=None):
+        """
+        Rebalance one list.
+
+        Returns:
+            dict: The number of rows updated and skipped.
+        """
+        rows = list(self.queryset.filter(**(group or {})).order_by(self.rank_field, 'pk')
+                    .values_list('pk', self.rank_field))
+        pks = [pk for pk, __ in rows]
+        current = [rank or '' for __, rank in rows]
+        targets = list(iter_default_ranks(len(rows)))
+        remaining = {index for index in range(len(rows)) if current[index] != targets[index]}
+        last = len(rows) - 1
+        updated = skipped = 0
+
+        while remaining:
+            # the new key must sort between the neighbours as they are now
+            movable = sorted(
+                index for index in remaining
+                if (index == 0 or current[index - 1] < targets[index])
+                and (index == last or targets[index] < current[index + 1])
+            )
+            if not movable:
+                # only happens with duplicate ranks, the next run will get further
+                break
+            for start in range(0, len(movable), self.batch_size):
+                batch = movable[start:start + self.batch_size]
+                moved = self._move(batch, pks, current, targets, group or {})
+                for index in batch:
+                    remaining.discard(index)
+                    if index in moved:
+                        current[index] = targets[index]
+                updated += len(moved)
+                skipped += len(batch) - len(moved)
+
+        skipped += len(remaining)
+        return {'updated': updated, 'skipped': skipped}
+
+    def _move(self, batch, pks, current, targets, group):
+        by_pk = {pks[index]: index for index in batch}
+        low = min(min(current[index], targets[index]) for index in batch)
+        high = max(max(current[index], targets[index]) for index in batch)
+        rank_field = self.rank_field
+        with transaction.atomic(using=self.queryset.db):
+            rows = self.queryset.select_for_update().filter(**group)
+            # lock the ranks of the range and its bounding neighbours, in rank order, waiting for concurrent
+            # reorders to commit, so the ranks compared below can't change until this batch is written
+            self._lock_neighbour(rows.filter(**{f'{rank_field}__lt': low}).order_by(f'-{rank_field}', '-pk'))
+            locked = list(rows.filter(Q(**{f'{rank_field}__gte': low, f'{rank_field}__lte': high}) | Q(pk__in=by_pk))
+                          .order_by(rank_field, 'pk').values_list('pk', rank_field))
+            self._lock_neighbour(rows.filter(**{f'{rank_field}__gt': high}).order_by(rank_field, 'pk'))
+            unchanged = {by_pk[pk] for pk, rank in locked if pk in by_pk and (rank or '') == current[by_pk[pk]]}
+            # the ranks as they are now, rows inserted or moved by others since the list was read included
+            ranks = sorted(rank or '' for __, rank in locked)
+            moved = {index for index in unchanged if self._only_row_between(ranks, current[index], targets[index])}
+            self.model._default_manager.using(self.queryset.db).bulk_update(
+                [self.model(pk=pks[index], **{rank_field: targets[index]}) for index in moved],
+                [rank_field])
+        return moved
+
+    @staticmethod
+    def _lock_neighbour(queryset):
+        list(queryset.values_list('pk', flat=True)[:1])
+
+    @staticmethod
+    def _only_row_between(ranks, old, new):
+        # the row keeps its place when no other rank lies between its old and new keys (both included)
+        return bisect_right(ranks, max(old, new)) - bisect_left(ranks, min(old, new)) == 1
+
+    def run(self, limit=None):
+        """
+        Find and rebalance the lists that need it.
+
+        Returns:
+            list: (group, stats, result) for each rebalanced list.
+        """
+        results = []
+        for group, stats in self.find_lists()[:limit]:
+            try:
+                result = self.rebalance(group)
+            except Exception:
+                logger.exception('Could not rebalance %s ranks of %s', self.model.__name__, group)
+                continue
+            results.append((group, stats, result))
+        return results
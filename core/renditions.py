@@ -0,0 +1,235 @@
+import atexit
+import hashlib
+import os
+import threading
+import time
+
+from PIL import Image, ImageOps
+from django.conf import settings
+
+FORMAT_EXTENSIONS = {
+    'JPEG': 'jpg',
+    'WEBP': 'webp',
+    'PNG': 'png',
+}
+
+
+def get_renditions(names=None):
+    """
+    Return the declared renditions (settings.IMAGE_RENDITIONS), optionally limited to `names`,
+    largest first so a single decoded image can be downscaled step by step.
+    """
+    renditions = settings.IMAGE_RENDITIONS
+    if names is not None:
+        renditions = {name: spec for name, spec in renditions.items() if name in names}
+    return dict(sorted(renditions.items(), key=lambda item: max(item[1]['size']), reverse=True))
+
+
+def rendition_key(source_key, spec):
+    """
+    Cache key for a rendition: changes whenever the source content or the rendition spec changes.
+    """
+    width, height = spec['size']
+    quality = spec.get('quality', settings.IMAGE_RENDITION_QUALITY)
+    raw = f"{source_key}:{width}x{height}:{spec['format']}:{quality}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def rendition_path(name, source_key, spec):
+    key = rendition_key(source_key, spec)
+    ext = FORMAT_EXTENSIONS.get(spec['format'], spec['format'].lower())
+    return os.path.join(settings.IMAGE_RENDITIONS_DIR, name, key[:2], f'{key}.{ext}')
+
+
+def open_scaled(image_path, size):
+    """
+    Load an image decoded at the smallest scale that still covers `size`, with its EXIF orientation applied.
+    JPEGs use draft mode (DCT scaling in the decoder), other formats are reduced right after loading.
+    """
+    target = max(size)
+    with Image.open(image_path) as image:
+        # request a square box so the draft still covers the size after an EXIF rotation
+        if image.format == 'JPEG':
+            image.draft('RGB', (target, target))
+        factor = min(image.width, image.height) // target
+        if factor >= 2:
+            image = image.reduce(factor)
+        return ImageOps.exif_transpose(image)
+
+
+def _scaled_size(size, box):
+    # the size Image.thumbnail would give: fit in the box, keep the aspect ratio, never upscale
+    ratio = min(box[0] / size[0], box[1] / size[1], 1)
+    return max(round(size[0] * ratio), 1), max(round(size[1] * ratio), 1)
+
+
+def _save_rendition(rendition, spec, path):
+    if spec['format'] == 'JPEG' and rendition.mode not in ('RGB', 'L'):
+        rendition = rendition.convert('RGB')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    rendition.save(tmp_path, spec['format'], quality=spec.get('quality', settings.IMAGE_RENDITION_QUALITY))
+    os.replace(tmp_path, path)
+
+
+def rendition_url(name, source_key, spec):
+    return os.path.join(settings.MEDIA_URL, rendition_path(name, source_key, spec))
+
+
+def render_renditions(file_name, source_key=None, names=None, known=None):
+    """
+    Render the declared renditions for an image stored under MEDIA_ROOT.
+    Renditions already in the cache are reused, the source is decoded once at the scale of the largest missing one.
+    `source_key` identifies the source content (the file content hash), the file name is used when missing.
+    `known` is a collection of rendition url paths from the index, these are trusted without checking the disk.
+    Does not touch the database so it can run in worker threads or processes.
+
+    Returns:
+        dict: rendition name -> url path, or None when the original is missing.
+    """
+    source_key = source_key or file_name
+    known = known or ()
+
+    result = {}
+    missing = {}
+    for name, spec in get_renditions(names).items():
+        path = rendition_path(name, source_key, spec)
+        url = os.path.join(settings.MEDIA_URL, path)
+        full_path = os.path.join(settings.MEDIA_ROOT, path)
+        if url in known:
+            pass
+        elif os.path.exists(full_path):
+            # refresh the mtime, eviction drops the least recently used renditions first
+            os.utime(full_path)
+        else:
+            missing[name] = (spec, full_path)
+        result[name] = url
+
+    if missing:
+        largest = max(max(spec['size']) for spec, __ in missing.values())
+        try:
+            image = open_scaled(os.path.join(settings.MEDIA_ROOT, file_name), (largest, largest))
+        except FileNotFoundError:
+            return None
+        # largest first, each rendition is downscaled from the previous one instead of a copy of the source
+        previous = image
+        for name, (spec, full_path) in missing.items():
+            size = _scaled_size(image.size, spec['size'])
+            source = previous if previous.width >= size[0] and previous.height >= size[1] else image
+            previous = source.resize(size, Image.LANCZOS) if source.size != size else source
+            _save_rendition(previous, spec, full_path)
+    return result
+
+
+class RenditionAccessLog:
+    """
+    Renditions whose URL was handed out, kept in memory: serving a URL does no filesystem I/O.
+    The mtimes of the recorded files are refreshed later by flush (on the thumbnail pipeline workers), so eviction
+    drops the least recently used renditions first. A URL is recorded at most once per
+    IMAGE_RENDITION_TOUCH_INTERVAL seconds by a process.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._recorded = None
+        self._last_flush = time.monotonic()
+
+    def record(self, url):
+        """
+        Returns:
+            bool: Whether a flush is due.
+        """
+        if not url or not is_rendition_url(url):
+            # legacy thumbnails are not part of the rendition cache
+            return False
+        if self._recorded is None:
+            # core.fns imports the models
+            from core.fns import LRUCache
+            self._recorded = LRUCache(self.maxsize)
+        now = time.monotonic()
+        recorded = self._recorded.get(url)
+        if recorded is not None and now - recorded < settings.IMAGE_RENDITION_TOUCH_INTERVAL:
+            return False
+        self._recorded.set(url, now)
+        with self._lock:
+            if len(self._pending) < self.maxsize:
+                self._pending.add(url)
+            return now - self._last_flush >= settings.IMAGE_RENDITION_ACCESS_FLUSH_INTERVAL
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, set()
+            self._last_flush = time.monotonic()
+        for url in pending:
+            try:
+                os.utime(rendition_file_path(url))
+            except FileNotFoundError:
+                pass
+        return len(pending)
+
+
+def is_rendition_url(url):
+    return url.startswith(os.path.join(settings.MEDIA_URL, settings.IMAGE_RENDITIONS_DIR, ''))
+
+
+def rendition_file_path(url):
+    return os.path.join(settings.MEDIA_ROOT, url[len(settings.MEDIA_URL):].lstrip('/'))
+
+
+rendition_accesses = RenditionAccessLog()
+atexit.register(rendition_accesses.flush)
+
+
+def scan_renditions():
+    """
+    Return the url paths of every rendition file on disk.
+    """
+    root = os.path.join(settings.MEDIA_ROOT, settings.IMAGE_RENDITIONS_DIR)
+    found = set()
+    for directory, __, files in os.walk(root):
+        for file_name in files:
+            if '.tmp' in file_name:
+                continue
+            found.add(os.path.join(settings.MEDIA_URL, os.path.relpath(os.path.join(directory, file_name),
+                                                                      settings.MEDIA_ROOT)))
+    return found
+
+
+def evict_renditions(max_bytes=None):
+    """
+    Delete the least recently used (served or rendered, see RenditionAccessLog) renditions until the cache fits
+    in `max_bytes`.
+    Renditions declared with 'pinned': True are never evicted.
+
+    Returns:
+        list: The url paths of the deleted renditions.
+    """
+    max_bytes = settings.IMAGE_RENDITIONS_MAX_BYTES if max_bytes is None else max_bytes
+    rendition_accesses.flush()
+    root = os.path.join(settings.MEDIA_ROOT, settings.IMAGE_RENDITIONS_DIR)
+    pinned = {name for name, spec in settings.IMAGE_RENDITIONS.items() if spec.get('pinned')}
+
+    entries = []
+    total = 0
+    for name in os.listdir(root) if os.path.isdir(root) else []:
+        for directory, __, files in os.walk(os.path.join(root, name)):
+            for file_name in files:
+                stat = os.stat(os.path.join(directory, file_name))
+                total += stat.st_size
+                if name not in pinned:
+                    entries.append((stat.st_mtime, stat.st_size, os.path.join(directory, file_name)))
+
+    deleted = []
+    entries.sort()
+    for __, size, full_path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(full_path)
+        except FileNotFoundError:
+            continue
+        total -= size
+        deleted.append(os.path.join(settings.MEDIA_URL, os.path.relpath(full_path, settings.MEDIA_ROOT)))
+    return deleted
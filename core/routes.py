@@ -0,0 +1,174 @@
+import threading
+from collections import namedtuple
+from urllib.parse import parse_qs, urlparse
+
+from django.apps import apps
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+EntityRoute = namedtuple('EntityRoute', ['model_name', 'path', 'label', 'base', 'id_param', 'related'])
+ParsedRoute = namedtuple('ParsedRoute', ['model_name', 'object_id', 'base_id'])
+
+BASE_PLACEHOLDER = '{base_id}'
+
+
+class RouteRegistry:
+    """
+    Frontend routes of the entity models, used for notification links and the entity links of notes and files.
+
+    A route is registered under the content type model name ('purchaseorder') with its path below
+    FRONTEND_APP_DIR/app/ ('job_hub/{base_id}/purchase_order'), the object id being added as the last segment,
+    or as the `id_param` query parameter. `base` is the attribute path to the base id on the instance
+    ('job.job_hub_id'). Models can also declare an `entity_route` dict of these options, registered at startup.
+
+    The registry is compiled once into lookup tables for links (by model name) and parsing (by path shape).
+    """
+
+    def __init__(self):
+        self._routes = {}
+        self._aliases = {}
+        self._lock = threading.Lock()
+        self._compiled = False
+        self._base_link = ''
+        self._shapes = {}
+        self._placeholders = ()
+
+    def register(self, model_name, path=None, label=None, base=None, id_param=None, related=(), aliases=()):
+        """
+        Args:
+            model_name (str): The content type model name.
+            path (str): The frontend path, '{base_id}' marks the base id segment. Defaults to the model name.
+            label (str): The display name. Defaults to the capitalized model name.
+            base (str): Dotted attribute path to the base id, on the linked instance.
+            id_param (str): Pass the object id as this query parameter instead of a path segment.
+            related (Iterable[str]): select_related lookups needed to read `base` in bulk.
+            aliases (Iterable[str]): Other names links can be requested with ('purchase_order').
+        """
+        with self._lock:
+            for alias in aliases:
+                self._aliases[alias] = model_name
+            self._routes[model_name] = EntityRoute(model_name, (path or model_name).strip('/'),
+                                                   label or model_name.capitalize(), base, id_param, tuple(related))
+            self._compiled = False
+
+    def autodiscover(self):
+        for model in apps.get_models():
+            options = getattr(model, 'entity_route', None)
+            if options is not None:
+                self.register(model._meta.model_name, **options)
+        self.compile()
+
+    def compile(self):
+        with self._lock:
+            shapes = {}
+            placeholders = set()
+            for route in self._routes.values():
+                segments = tuple(route.path.split('/'))
+                positions = tuple(index for index, segment in enumerate(segments) if segment == BASE_PLACEHOLDER)
+                placeholders.add((len(segments), positions))
+                shapes[segments] = route
+            self._shapes = shapes
+            self._placeholders = tuple(placeholders)
+            self._base_link = (settings.FRONTEND_APP_DIR or '') + '/app/'
+            self._compiled = True
+
+    def get(self, model_name):
+        if not self._compiled:
+            self.compile()
+        return self._routes.get(self._aliases.get(model_name, model_name))
+
+    def label(self, model_name):
+        route = self.get(model_name)
+        return route.label if route else model_name.capitalize()
+
+    def link(self, model_name, object_id, base_id=None):
+        route = self.get(model_name)
+        if route is None:
+            return self._base_link + model_name + '/' + str(object_id or '')
+        path = route.path.replace(BASE_PLACEHOLDER, str(base_id or 0))
+        if route.id_param:
+            return self._base_link + path + ('?' + route.id_param + '=' + str(object_id) if object_id else '')
+        return self._base_link + path + '/' + str(object_id or '')
+
+    def links(self, targets):
+        """
+        Links for many (model_name, object_id, base_id) tuples.
+        """
+        return [self.link(*target) for target in targets]
+
+    def base_id(self, model_name, instance):
+        """
+        The base id of a linked instance. `instance` can be a callable returning it, only called for routes
+        with a base (so a generic relation target is only loaded when needed).
+        """
+        route = self.get(model_name)
+        if route is None or route.base is None or instance is None:
+            return None
+        value = instance() if callable(instance) else instance
+        for attribute in route.base.split('.'):
+            value = getattr(value, attribute, None)
+            if value is None:
+                return None
+        return value
+
+    def instance_link(self, model_name, object_id, instance=None):
+        return self.link(model_name, object_id, self.base_id(model_name, instance))
+
+    def parse(self, url):
+        """
+        Parse a frontend link back to its route.
+
+        Returns:
+            ParsedRoute: (model_name, object_id, base_id), or None when no registered route matches.
+        """
+        if not self._compiled:
+            self.compile()
+        parsed_url = urlparse(url)
+        path = parsed_url.path
+        app_path = urlparse(self._base_link).path
+        if not path.startswith(app_path):
+            return None
+        segments = tuple(path[len(app_path):].strip('/').split('/'))
+        query = parse_qs(parsed_url.query)
+
+        for length, positions in self._placeholders:
+            # the object id is either the segment after the path or a query parameter
+            for has_id_segment in (True, False):
+                if len(segments) != length + has_id_segment:
+                    continue
+                shape = tuple(BASE_PLACEHOLDER if index in positions else segment
+                              for index, segment in enumerate(segments[:length]))
+                route = self._shapes.get(shape)
+                if route is None or bool(route.id_param) == has_id_segment:
+                    continue
+                object_id = segments[-1] if has_id_segment else query.get(route.id_param, [None])[0]
+                base_id = segments[positions[0]] if positions else None
+                return ParsedRoute(route.model_name, _to_id(object_id), _to_id(base_id))
+        return None
+
+
+def _to_id(value):
+    return int(value) if value and value.isdigit() else value or None
+
+
+entity_routes = RouteRegistry()
+
+# the frontend routes of the entity models of the apps built on this project
+entity_routes.register('artwork', 'artwork/artworks')
+entity_routes.register('artist', 'artwork/artists')
+entity_routes.register('collection', 'artwork/collections')
+entity_routes.register('collection_folder', 'artwork/collections/folder')
+entity_routes.register('quotation', 'job_hub/{base_id}/quotation', base='job_hub_id')
+entity_routes.register('purchaseorder', 'job_hub/{base_id}/purchase_order', label='Purchase Order',
+                       base='job_hub_id', aliases=('purchase_order',))
+entity_routes.register('jobitem', 'job_hub/{base_id}/item', label='Job Item', base='job.job_hub_id',
+                       related=('job',), aliases=('job_item',))
+entity_routes.register('jobhub', 'job_hub', label='Job Hub', aliases=('job_hub',))
+entity_routes.register('messaging', 'messaging', id_param='c')
+
+
+@receiver(setting_changed)
+def reset_entity_routes(setting, **kwargs):
+    if setting == 'FRONTEND_APP_DIR':
+        entity_routes.compile()
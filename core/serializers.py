@@ -1,13 +1,21 @@
 import mimetypes
 
+from django.conf import settings
 from django.contrib.admin.models import LogEntry
 from django.contrib.auth import get_user_model, password_validation
 from django.contrib.auth.models import update_last_login
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from django.urls import reverse
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
 from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
 
 from .models import Note, File, ImageFile
-from core.fns import json_loads, media_url
+from .prefetch import prefetch_entities, prefetch_history
+from .routes import entity_routes
+from core.fns import json_loads, media_url, media_urls
+from core.permissions import permission_claims, user_groups
 from rest_framework import serializers
 
 User = get_user_model()
@@ -43,58 +51,102 @@ class SerializerUserDefaults:
 
 
 class EntitySerializer(serializers.ModelSerializer):
+    """
+    With ENTITY_HISTORY_MODE = 'inline' the history of a whole list is loaded in one query
+    (capped to ENTITY_HISTORY_LIMIT entries per object).
+    With 'url' only a link to the history action of the view (see core.viewsets.HistoryMixin) is returned.
+    """
     history = serializers.SerializerMethodField(read_only=True)
 
     def get_history(self, instance):
+        view = self.context.get('view')
+        if settings.ENTITY_HISTORY_MODE == 'url' and hasattr(view, 'history'):
+            request = self.context.get('request')
+            url = reverse(f'{view.basename}-history', kwargs={'pk': instance.pk})
+            return request.build_absolute_uri(url) if request else url
+        if not hasattr(instance, '_prefetched_history'):
+            # the first row of a list loads the history of every row
+            prefetch_history(_list_batch(self, instance), settings.ENTITY_HISTORY_LIMIT)
         return LogEntrySerializer(instance.history(), many=True).data
 
 
-class FileSerializer(serializers.ModelSerializer):
+class EntityLinkSerializer(serializers.ModelSerializer):
+    """
+    Frontend link and type name of the entity of rows using core.models.EntityLinkMixin,
+    'entity_link' and 'entity_type_name' have to be listed in the Meta.fields of subclasses.
+    In a list the first row that needs its entity for the link (routes with a base id) loads them for all rows,
+    one query per content type.
+    """
+    entity_link = serializers.SerializerMethodField()
+    entity_type_name = serializers.SerializerMethodField()
+
+    def get_entity_link(self, instance):
+        if self._needs_entity(instance):
+            prefetch_entities([row for row in _list_batch(self, instance) if self._needs_entity(row)])
+        return instance.entity_link
+
+    def get_entity_type_name(self, instance):
+        return instance.entity_type_name
+
+    @staticmethod
+    def _needs_entity(instance):
+        route = entity_routes.get(instance.entity_model)
+        return bool(route and route.base) and not instance._meta.get_field('entity').is_cached(instance)
+
+
+def _list_batch(serializer, instance):
+    # the rows of the list being serialized, so data for all of them can be loaded at once
+    if isinstance(serializer.parent, serializers.ListSerializer) and serializer.parent.instance is not None:
+        batch = list(serializer.parent.instance)
+        if any(row is instance for row in batch):
+            return batch
+    return [instance]
+
+
+class BaseFileSerializer(serializers.ModelSerializer):
     file = serializers.CharField(source='file.name')
+    download_type = 'file'
 
     def to_representation(self, instance):
+        # built from the columns captured at upload, listing files does no storage I/O
         representation = super().to_representation(instance)
         if 'file' in representation and representation['file']:
             representation["url"] = media_url(representation['file'])
-            representation["size"] = instance.file.size
+            representation["size"] = instance.file_size
             representation["name"] = instance.name
-            representation["type"] = mimetypes.guess_type(representation["file"])[0]
+            representation["type"] = instance.mime_type or mimetypes.guess_type(representation["file"])[0]
+            representation["download_url"] = reverse('file-download', kwargs={'file_type': self.download_type,
+                                                                              'pk': instance.pk})
         else:
             representation["url"] = ""
+            representation["download_url"] = ""
             representation["size"] = ""
             representation["name"] = ""
             representation["type"] = ""
         return representation
 
+
+class FileSerializer(BaseFileSerializer):
     class Meta:
         model = File
         fields = ['id', 'object_id', 'file', 'created_at']
 
 
-class ImageFileSerializer(serializers.ModelSerializer):
+class ImageFileSerializer(BaseFileSerializer):
+    download_type = 'image'
     img_thumbnail = serializers.SerializerMethodField()
-    file = serializers.CharField(source='file.name')
+    renditions = serializers.SerializerMethodField()
 
     def get_img_thumbnail(self, instance):
         return media_url(instance.img_thumbnail())
 
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        if 'file' in representation and representation['file']:
-            representation["url"] = media_url(representation["file"])
-            representation["size"] = instance.file.size
-            representation["name"] = instance.name
-            representation["type"] = mimetypes.guess_type(representation["file"])[0]
-        else:
-            representation["url"] = ""
-            representation["size"] = ""
-            representation["name"] = ""
-            representation["type"] = ""
-        return representation
+    def get_renditions(self, instance):
+        names = list(settings.IMAGE_RENDITIONS)
+        return dict(zip(names, media_urls(instance.rendition(name) for name in names)))
 
     class Meta:
         model = ImageFile
-        fields = ['id', 'object_id', 'file', 'created_at', 'img_height', 'img_width', 'img_thumbnail']
+        fields = ['id', 'object_id', 'file', 'created_at', 'img_height', 'img_width', 'img_thumbnail', 'renditions']
 
 
 class UserInfoSerializer(serializers.ModelSerializer):
@@ -106,7 +158,7 @@ class LoginUserSerializer(serializers.ModelSerializer):
     groups = serializers.SerializerMethodField()
 
     def get_groups(self, user):
-        groups = list(user.groups.values_list('name', flat=True))
+        groups = list(user_groups(user))
         if user.is_superuser:
             groups.append('Super Admin')
         if not len(groups):
@@ -127,10 +179,13 @@ class UserAccountSerializer(serializers.ModelSerializer):
     log_entries = serializers.SerializerMethodField()
 
     def get_staff_roles(self, instance):
-        return instance.groups.values_list('name', flat=True)
+        return user_groups(instance)
 
     def get_log_entries(self, instance):
-        return LogEntrySerializer(LogEntry.objects.filter(user=instance)[:100], many=True).data
+        # the activity feed is paginated separately, only its link is returned
+        request = self.context.get('request')
+        url = reverse('user-activity')
+        return request.build_absolute_uri(url) if request else url
 
     class Meta:
         model = User
@@ -140,6 +195,14 @@ class UserAccountSerializer(serializers.ModelSerializer):
 
 class LoginSerializer(TokenObtainPairSerializer):
 
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        if settings.JWT_PERMISSION_CLAIMS:
+            for claim, value in permission_claims(user).items():
+                token[claim] = value
+        return token
+
     def validate(self, attrs):
         data = super().validate(attrs)
 
@@ -162,6 +225,24 @@ class LoginSerializer(TokenObtainPairSerializer):
         return data
 
 
+class RefreshSerializer(TokenRefreshSerializer):
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        if settings.JWT_PERMISSION_CLAIMS:
+            # claims copied from the refresh token may be stale, the new access token gets current ones
+            access = AccessToken(data['access'], verify=False)
+            try:
+                user = User.objects.get(**{api_settings.USER_ID_FIELD: access[api_settings.USER_ID_CLAIM]})
+            except User.DoesNotExist:
+                # deleted after the token was issued, as JWTAuthentication treats it
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            for claim, value in permission_claims(user).items():
+                access[claim] = value
+            data['access'] = str(access)
+        return data
+
+
 class ChangePasswordSerializer(serializers.Serializer):
     old_password = serializers.CharField(max_length=128, write_only=True, required=True)
     new_password1 = serializers.CharField(max_length=128, write_only=True, required=True)
@@ -61,10 +61,10 @@ INSTALLED_APPS = [
     'corsheaders',
 ]
 REST_FRAMEWORK = {
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.ListPagination',
     # 'PAGE_SIZE': 200,
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.ClaimsJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     # 'DEFAULT_RENDERER_CLASSES': (
@@ -78,7 +78,7 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': True,
 }
 AUTHENTICATION_BACKENDS = (
-    'django.contrib.auth.backends.ModelBackend',  # this is default
+    'core.permissions.CachedModelBackend',  # ModelBackend with the permission snapshot
     'guardian.backends.ObjectPermissionBackend',
 )
 
@@ -91,8 +91,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'django_currentuser.middleware.ThreadLocalUserMiddleware',
+    'core.middleware.current_user_middleware.CurrentUserMiddleware',
     'core.middleware.last_seen_middleware.UpdateLastSeenMiddleware',
+    'core.middleware.audit_buffer_middleware.AuditBufferMiddleware',
 ]
 CORS_ALLOW_HEADERS = (
     *default_headers,
@@ -183,9 +184,43 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static/')
 MEDIA_ROOT = BASE_DIR / "media"
 ENTITY_FILES_BASE = "entity_files"
 ENTITY_FILES_DIR = os.path.join(MEDIA_ROOT, ENTITY_FILES_BASE)
+# uploads are hashed while streamed in, BaseFile stores identical content once
+FILE_UPLOAD_HANDLERS = [
+    'core.uploads.HashingMemoryFileUploadHandler',
+    'core.uploads.HashingTemporaryFileUploadHandler',
+]
 STORAGE_URL = ENV.get('STORAGE_URL')
 STORAGE_TOKEN = ENV.get('STORAGE_TOKEN')
+# With the storage account key media URLs get a read only SAS per blob instead of STORAGE_TOKEN, valid for
+# STORAGE_SAS_TTL seconds (see core.media.MediaUrlBuilder)
+STORAGE_ACCOUNT_KEY = ENV.get('STORAGE_ACCOUNT_KEY')
+STORAGE_SAS_TTL = 3600
+STORAGE_SAS_CACHE_SIZE = 4096
 FRONTEND_APP_DIR = ENV.get('FRONTEND_APP_DIR')
+# File downloads offload: None (stream from Django), 'nginx' (X-Accel-Redirect) or 'apache' (X-Sendfile)
+SENDFILE_BACKEND = ENV.get('SENDFILE_BACKEND') or None
+# nginx internal location aliased to MEDIA_ROOT
+SENDFILE_URL_PREFIX = '/protected/'
+# Background thumbnail generation, 0 workers renders thumbnails inline
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_BATCH_SIZE = 50
+# Images with a missing original or a failed rendering are tried again after this many seconds
+THUMBNAIL_RETRY_INTERVAL = 300
+THUMBNAIL_PLACEHOLDER_URL = 'https://dummyimage.com/150/bbbbbb/eeeeee&text=Processing'
+# Image renditions, 'thumb' is also stored in ImageFile.thumbnail. Pinned renditions are never evicted
+IMAGE_RENDITIONS = {
+    'thumb': {'size': (200, 200), 'format': 'JPEG', 'pinned': True},
+    'list': {'size': (400, 400), 'format': 'WEBP'},
+    'card': {'size': (800, 800), 'format': 'WEBP'},
+    'preview': {'size': (1600, 1600), 'format': 'JPEG'},
+}
+IMAGE_RENDITION_QUALITY = 85
+IMAGE_RENDITIONS_DIR = 'renditions'
+IMAGE_RENDITIONS_MAX_BYTES = 10 * 1024 ** 3
+# Served renditions are recorded as used (for the eviction) at most once per IMAGE_RENDITION_TOUCH_INTERVAL seconds,
+# the recorded file mtimes are refreshed by the thumbnail workers every IMAGE_RENDITION_ACCESS_FLUSH_INTERVAL seconds
+IMAGE_RENDITION_TOUCH_INTERVAL = 3600
+IMAGE_RENDITION_ACCESS_FLUSH_INTERVAL = 60
 CORS_ALLOWED_ORIGINS = [
     f"{urlparse(FRONTEND_APP_DIR).scheme}://{urlparse(FRONTEND_APP_DIR).netloc}",
 ]
@@ -216,3 +251,31 @@ TINYMCE_DEFAULT_CONFIG = {
 }
 
 LIST_PER_PAGE = 20
+
+# EntitySerializer history: 'inline' (latest ENTITY_HISTORY_LIMIT entries, None for all) or 'url' (link only)
+ENTITY_HISTORY_MODE = 'inline'
+ENTITY_HISTORY_LIMIT = 20
+# Buffered EntityModel.log_action entries are written on commit ('commit') or by a background thread ('background')
+AUDIT_WRITER = 'commit'
+# User.last_seen is updated at most once per LAST_SEEN_INTERVAL seconds, buffered updates are written
+# every LAST_SEEN_FLUSH_INTERVAL seconds by a background thread
+LAST_SEEN_INTERVAL = 60
+LAST_SEEN_FLUSH_INTERVAL = 10
+# Number of sanitize_html results memoized by content hash
+SANITIZE_HTML_CACHE_SIZE = 1024
+# Cache the groups and permissions of users across requests for this many seconds (0: once per request only).
+# Changes to groups and permissions invalidate it through version stamps kept in the default cache
+PERMISSION_CACHE_TIMEOUT = 0
+# Embed the groups and permissions of users in their access tokens, checks use them while they are current.
+# As PERMISSION_CACHE_TIMEOUT, this needs a default cache shared by the processes (see CACHES), otherwise a change
+# is only seen by the process handling it. The app refuses to start with a local memory or dummy cache
+JWT_PERMISSION_CLAIMS = False
+# Cache users resolved from access tokens for this many seconds (0: load the user on every request), in the
+# Django cache, which must then be shared by the processes, and for USER_CACHE_LOCAL_TTL seconds in process
+USER_CACHE_TIMEOUT = 0
+USER_CACHE_LOCAL_TTL = 10
+USER_CACHE_SIZE = 1024
+# List counts of core.pagination.ListPagination: 'exact', 'estimate' (PostgreSQL statistics, counted exactly
+# below PAGINATION_EXACT_COUNT_BELOW rows) or None
+PAGINATION_COUNT = 'estimate'
+PAGINATION_EXACT_COUNT_BELOW = 1000
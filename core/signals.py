@@ -0,0 +1,45 @@
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django_cleanup import cleanup
+
+from core.authentication import user_cache
+from core.models import BaseFile
+from core.permissions import bump_permissions_version, bump_user_permissions_version
+
+
+def release_file(sender, instance, **kwargs):
+    instance.release_file(instance.blob_id, instance.file.name)
+
+
+def connect_file_models():
+    # files of BaseFile rows may be shared, django_cleanup must not delete them with the row
+    for model in apps.get_models():
+        if issubclass(model, BaseFile):
+            cleanup.ignore(model)
+            post_delete.connect(release_file, sender=model, dispatch_uid=f'release_file_{model._meta.label_lower}')
+
+
+def connect_permission_models():
+    # any change to groups or permissions invalidates the cached permission snapshots
+    user_model = get_user_model()
+    for sender in (user_model.groups.through, user_model.user_permissions.through):
+        m2m_changed.connect(bump_user_permissions_version, sender=sender,
+                            dispatch_uid=f'permissions_{sender._meta.label_lower}')
+    m2m_changed.connect(bump_permissions_version, sender=Group.permissions.through,
+                        dispatch_uid='permissions_group_permissions')
+    for model in (Group, Permission):
+        post_save.connect(bump_permissions_version, sender=model, dispatch_uid=f'permissions_{model._meta.label_lower}')
+        post_delete.connect(bump_permissions_version, sender=model, dispatch_uid=f'permissions_{model._meta.label_lower}')
+
+
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
+
+
+def connect_user_cache():
+    # saving a user (deactivation, password or group flag changes) drops it from the authentication cache
+    user_model = get_user_model()
+    post_save.connect(invalidate_cached_user, sender=user_model, dispatch_uid='user_cache_save')
+    post_delete.connect(invalidate_cached_user, sender=user_model, dispatch_uid='user_cache_delete')
@@ -0,0 +1,124 @@
+import datetime
+from types import SimpleNamespace
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import InMemoryStorage
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.utils.http import http_date
+
+from core.downloads import file_etag, parse_range, serve_file
+
+CONTENT = bytes(range(256)) * 40
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range(' bytes=10-10 ', 1000), (10, 10))
+
+    def test_clamped_to_size(self):
+        self.assertEqual(parse_range('bytes=900-5000', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-5000', 1000), (0, 999))
+
+    def test_unusable(self):
+        for header in (None, '', 'bytes=-', 'bytes=0-9,20-29', 'items=0-9', 'bytes=a-b'):
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range(header, 1000))
+
+    def test_unsatisfiable(self):
+        self.assertIs(parse_range('bytes=1000-', 1000), False)
+        self.assertIs(parse_range('bytes=20-10', 1000), False)
+        self.assertIs(parse_range('bytes=-0', 1000), False)
+
+
+@override_settings(SENDFILE_BACKEND=None)
+class ServeFileTests(SimpleTestCase):
+    def setUp(self):
+        storage = InMemoryStorage()
+        name = storage.save('entity_files/report.bin', ContentFile(CONTENT))
+        self.instance = SimpleNamespace(
+            pk=3, content_hash='abc123', file_size=len(CONTENT), mime_type='application/pdf', name='report 1.pdf',
+            updated_at=datetime.datetime(2024, 3, 1, 12, 0, tzinfo=datetime.timezone.utc),
+            file=SimpleNamespace(name=name, storage=storage, size=len(CONTENT)),
+        )
+        self.etag = '"abc123"'
+        self.last_modified = http_date(self.instance.updated_at.timestamp())
+
+    def get(self, **headers):
+        return serve_file(RequestFactory().get('/download', headers=headers), self.instance)
+
+    @staticmethod
+    def content(response):
+        return b''.join(response.streaming_content)
+
+    def test_full(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response), CONTENT)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(response['Last-Modified'], self.last_modified)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Content-Disposition'], "attachment; filename*=UTF-8''report%201.pdf")
+
+    def test_range(self):
+        response = self.get(Range='bytes=100-65636')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-{len(CONTENT) - 1}/{len(CONTENT)}')
+        self.assertEqual(response['Content-Length'], str(len(CONTENT) - 100))
+        self.assertEqual(self.content(response), CONTENT[100:])
+
+    def test_suffix_range(self):
+        response = self.get(Range='bytes=-10')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.content(response), CONTENT[-10:])
+
+    def test_unsatisfiable_range(self):
+        response = self.get(Range=f'bytes={len(CONTENT)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(CONTENT)}')
+
+    def test_if_range(self):
+        for if_range in (self.etag, self.last_modified):
+            with self.subTest(if_range=if_range):
+                response = self.get(Range='bytes=0-9', If_Range=if_range)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(self.content(response), CONTENT[:10])
+
+    def test_if_range_changed(self):
+        # the client copy is outdated, the whole file is sent instead of the range
+        stale_date = http_date(self.instance.updated_at.timestamp() - 60)
+        for if_range in ('"other"', 'W/"abc123"', stale_date):
+            with self.subTest(if_range=if_range):
+                response = self.get(Range='bytes=0-9', If_Range=if_range)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.content(response), CONTENT)
+
+    def test_not_modified(self):
+        for headers in ({'If-None-Match': self.etag}, {'If-None-Match': f'"other", {self.etag}'},
+                        {'If-Modified-Since': self.last_modified}):
+            with self.subTest(headers=headers):
+                response = self.get(**headers)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], self.etag)
+
+    def test_modified(self):
+        self.assertEqual(self.get(**{'If-None-Match': '"other"'}).status_code, 200)
+
+    def test_precondition_failed(self):
+        self.assertEqual(self.get(**{'If-Match': '"other"'}).status_code, 412)
+        self.assertEqual(self.get(**{'If-Match': self.etag}).status_code, 200)
+
+    def test_etag_without_hash(self):
+        self.instance.content_hash = None
+        self.assertEqual(file_etag(self.instance), f'"3-{int(self.instance.updated_at.timestamp())}"')
+
+    @override_settings(SENDFILE_BACKEND='nginx', SENDFILE_URL_PREFIX='/protected/')
+    def test_nginx(self):
+        response = self.get(Range='bytes=0-9')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/entity_files/report.bin')
+        self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(response.content, b'')
@@ -0,0 +1,70 @@
+import base64
+import datetime
+import json
+
+from django.contrib.admin.models import LogEntry
+from django.db.models import Q
+from django.test import RequestFactory, SimpleTestCase
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+
+from core.pagination import KeysetPagination
+
+
+class CursorTests(SimpleTestCase):
+    def setUp(self):
+        self.pagination = KeysetPagination()
+        self.pagination.fields = [('action_time', True), ('id', True)]
+
+    def decode(self, cursor):
+        request = Request(RequestFactory().get('/', {'cursor': cursor} if cursor is not None else {}))
+        return self.pagination.decode_cursor(request, LogEntry)
+
+    def test_round_trip(self):
+        action_time = datetime.datetime(2024, 3, 1, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc)
+        for reverse in (False, True):
+            cursor = self.pagination.encode_cursor([action_time, 42], reverse)
+            self.assertEqual(self.decode(cursor), ([action_time, 42], reverse))
+
+    def test_keeps_microseconds(self):
+        # DjangoJSONEncoder would cut them to milliseconds and rows of the same millisecond would be skipped
+        action_time = datetime.datetime(2024, 3, 1, 12, 30, 15, 999999, tzinfo=datetime.timezone.utc)
+        position, __ = self.decode(self.pagination.encode_cursor([action_time, 1]))
+        self.assertEqual(position[0].microsecond, 999999)
+
+    def test_url_safe_without_padding(self):
+        cursor = self.pagination.encode_cursor(['2024-03-01T12:30:15+00:00', 10 ** 12])
+        self.assertNotIn('=', cursor)
+        self.assertNotIn('+', cursor)
+        self.assertNotIn('/', cursor)
+
+    def test_no_cursor(self):
+        self.assertEqual(self.decode(None), (None, False))
+        self.assertEqual(self.decode(''), (None, False))
+
+    def test_invalid_cursor(self):
+        def encode(values):
+            return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+        for cursor in (
+            'not a cursor',
+            encode({'id': 1}),
+            encode([0, '2024-03-01T12:30:15+00:00']),
+            encode([0, '2024-03-01T12:30:15+00:00', 1, 2]),
+            encode([0, 'yesterday', 1]),
+            encode([0, '2024-03-01T12:30:15+00:00', 'one']),
+        ):
+            with self.subTest(cursor=cursor), self.assertRaises(NotFound):
+                self.decode(cursor)
+
+    def test_unknown_field(self):
+        self.pagination.fields = [('missing', False), ('id', False)]
+        with self.assertRaises(NotFound):
+            self.decode(self.pagination.encode_cursor(['x', 1]))
+
+    def test_after_position(self):
+        # (action_time, id) < (t, 2) for the next page, > for the previous one
+        self.assertEqual(self.pagination.after_position(['t', 2]),
+                         Q(action_time__lt='t') | Q(action_time='t') & Q(id__lt=2))
+        self.assertEqual(self.pagination.after_position(['t', 2], reverse=True),
+                         Q(action_time__gt='t') | Q(action_time='t') & Q(id__gt=2))
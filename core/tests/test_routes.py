@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase, override_settings
+
+from core.routes import ParsedRoute, RouteRegistry
+
+APP = 'https://app.example.com/app/'
+
+
+@override_settings(FRONTEND_APP_DIR='https://app.example.com')
+class RouteRegistryTests(SimpleTestCase):
+    def setUp(self):
+        self.routes = RouteRegistry()
+        self.routes.register('artwork', 'artwork/artworks')
+        self.routes.register('collection_folder', 'artwork/collections/folder')
+        self.routes.register('purchaseorder', 'job_hub/{base_id}/purchase_order', label='Purchase Order',
+                             base='job_hub_id', aliases=('purchase_order',))
+        self.routes.register('jobitem', 'job_hub/{base_id}/item', base='job.job_hub_id', related=('job',))
+        self.routes.register('jobhub', 'job_hub')
+        self.routes.register('messaging', 'messaging', id_param='c')
+
+    def test_link(self):
+        self.assertEqual(self.routes.link('artwork', 5), APP + 'artwork/artworks/5')
+        self.assertEqual(self.routes.link('collection_folder', 7), APP + 'artwork/collections/folder/7')
+        self.assertEqual(self.routes.link('purchaseorder', 3, 9), APP + 'job_hub/9/purchase_order/3')
+        self.assertEqual(self.routes.link('purchase_order', 3, 9), APP + 'job_hub/9/purchase_order/3')
+        self.assertEqual(self.routes.link('messaging', 12), APP + 'messaging?c=12')
+
+    def test_link_without_ids(self):
+        self.assertEqual(self.routes.link('purchaseorder', 3), APP + 'job_hub/0/purchase_order/3')
+        self.assertEqual(self.routes.link('artwork', None), APP + 'artwork/artworks/')
+        self.assertEqual(self.routes.link('messaging', None), APP + 'messaging')
+
+    def test_link_unregistered(self):
+        self.assertEqual(self.routes.link('invoice', 4), APP + 'invoice/4')
+
+    def test_parse(self):
+        self.assertEqual(self.routes.parse(APP + 'artwork/artworks/5'), ParsedRoute('artwork', 5, None))
+        self.assertEqual(self.routes.parse(APP + 'artwork/collections/folder/7'),
+                         ParsedRoute('collection_folder', 7, None))
+        self.assertEqual(self.routes.parse(APP + 'job_hub/9/purchase_order/3'), ParsedRoute('purchaseorder', 3, 9))
+        self.assertEqual(self.routes.parse(APP + 'job_hub/9/item/4'), ParsedRoute('jobitem', 4, 9))
+        self.assertEqual(self.routes.parse(APP + 'job_hub/9'), ParsedRoute('jobhub', 9, None))
+        self.assertEqual(self.routes.parse(APP + 'messaging?c=12'), ParsedRoute('messaging', 12, None))
+
+    def test_parse_round_trip(self):
+        for model_name, object_id, base_id in [('artwork', 5, None), ('purchaseorder', 3, 9), ('jobitem', 4, 8),
+                                               ('jobhub', 2, None), ('messaging', 12, None)]:
+            with self.subTest(model_name=model_name):
+                link = self.routes.link(model_name, object_id, base_id)
+                self.assertEqual(self.routes.parse(link), ParsedRoute(model_name, object_id, base_id))
+
+    def test_parse_unknown(self):
+        self.assertIsNone(self.routes.parse('https://other.example.com/elsewhere/artwork/artworks/5'))
+        self.assertIsNone(self.routes.parse(APP + 'artwork/unknown/5'))
+        self.assertIsNone(self.routes.parse(APP + 'job_hub/9/purchase_order/3/extra'))
+        self.assertEqual(self.routes.parse(APP + 'messaging'), ParsedRoute('messaging', None, None))
+
+    def test_instance_link(self):
+        job_item = SimpleNamespace(job=SimpleNamespace(job_hub_id=8))
+        self.assertEqual(self.routes.instance_link('jobitem', 4, job_item), APP + 'job_hub/8/item/4')
+        self.assertEqual(self.routes.instance_link('jobitem', 4, lambda: job_item), APP + 'job_hub/8/item/4')
+        self.assertEqual(self.routes.instance_link('jobitem', 4, SimpleNamespace(job=None)), APP + 'job_hub/0/item/4')
+
+    def test_instance_only_loaded_for_base_routes(self):
+        def load():
+            raise AssertionError('the instance is not needed for routes without a base')
+
+        self.assertEqual(self.routes.instance_link('artwork', 5, load), APP + 'artwork/artworks/5')
+
+    def test_register_recompiles(self):
+        self.assertIsNone(self.routes.parse(APP + 'invoices/4'))
+        self.routes.register('invoice', 'invoices', label='Invoice')
+        self.assertEqual(self.routes.parse(APP + 'invoices/4'), ParsedRoute('invoice', 4, None))
+        self.assertEqual(self.routes.label('invoice'), 'Invoice')
+        self.assertEqual(self.routes.label('jobitem'), 'Jobitem')
@@ -0,0 +1,159 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections
+
+from core.renditions import render_renditions, rendition_accesses
+
+logger = logging.getLogger(__name__)
+
+NO_IMAGE_URL = 'https://dummyimage.com/150/bbbbbb/eeeeee&text=No+Image'
+IMAGE_ERROR_URL = 'https://dummyimage.com/150/bbbbbb/eeeeee&text=Image+Error'
+
+
+def get_thumbnail_path(original_path):
+    # Split the original path into directory and filename
+    directory, filename = os.path.split(original_path)
+    thumbnails_dir = os.path.join(directory, 'thumbnails')
+    # Append '_thumb' to the filename before the extension
+    name, ext = os.path.splitext(filename)
+    new_filename = f"{name}_thumb{ext}"
+
+    # Generate the new thumbnail path
+    thumbnail_path = os.path.join(thumbnails_dir, new_filename)
+    return thumbnail_path
+
+
+class ThumbnailPipeline:
+    """
+    Renders ImageFile thumbnails and the other declared renditions on a background
+    thread pool and writes the resulting paths back to the database in batches.
+
+    With THUMBNAIL_WORKERS = 0 thumbnails are rendered inline (useful for scripts and tests).
+    Images whose original is missing ('missing') or could not be rendered ('error') are remembered in memory,
+    nothing is stored for them, and retried once THUMBNAIL_RETRY_INTERVAL seconds passed.
+    """
+
+    def __init__(self, workers=None, batch_size=None, max_failures=10000):
+        self.workers = settings.THUMBNAIL_WORKERS if workers is None else workers
+        self.batch_size = batch_size or settings.THUMBNAIL_BATCH_SIZE
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = set()
+        self.max_failures = max_failures
+        self._failures = None
+        self._results = []
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='thumbnails')
+            return self._executor
+
+    def is_pending(self, pk):
+        return pk in self._pending
+
+    @property
+    def _failed(self):
+        # pk: (reason, time), core.fns imports the models
+        if self._failures is None:
+            from core.fns import LRUCache
+            self._failures = LRUCache(self.max_failures)
+        return self._failures
+
+    def get_failure(self, pk):
+        """
+        Returns:
+            str: 'missing' or 'error' when the last attempt failed less than THUMBNAIL_RETRY_INTERVAL seconds ago.
+        """
+        failure = self._failed.get(pk)
+        if failure is None:
+            return None
+        reason, failed_at = failure
+        if time.monotonic() - failed_at >= settings.THUMBNAIL_RETRY_INTERVAL:
+            self._failed.pop(pk)
+            return None
+        return reason
+
+    def enqueue(self, image_file):
+        """
+        Schedule rendition generation for an ImageFile.
+        Returns False if the row is already queued or has nothing to render.
+        """
+        if not image_file.pk or not image_file.file:
+            return False
+        with self._lock:
+            if image_file.pk in self._pending:
+                return False
+            self._pending.add(image_file.pk)
+        self._failed.pop(image_file.pk)
+        if self.workers <= 0:
+            self._render(image_file.pk, image_file.file.name, image_file.content_hash)
+        else:
+            self._get_executor().submit(self._render, image_file.pk, image_file.file.name, image_file.content_hash)
+        return True
+
+    def record_access(self, url):
+        """
+        Record that a rendition URL was handed out, the file mtimes are refreshed by a worker.
+        """
+        if rendition_accesses.record(url):
+            if self.workers <= 0:
+                rendition_accesses.flush()
+            else:
+                self._get_executor().submit(rendition_accesses.flush)
+
+    def _known_renditions(self, content_hash):
+        """
+        Renditions already indexed for the same content, they are reused without checking the disk.
+        """
+        if not content_hash:
+            return set()
+        image_file_model = apps.get_model('core', 'ImageFile')
+        known = set()
+        for renditions in image_file_model.objects.filter(content_hash=content_hash).exclude(
+                renditions={}).values_list('renditions', flat=True)[:10]:
+            known.update(renditions.values())
+        return known
+
+    def _render(self, pk, file_name, content_hash=None):
+        try:
+            renditions = render_renditions(file_name, content_hash, known=self._known_renditions(content_hash))
+        except Exception:
+            logger.exception('Thumbnail generation failed for image file %s', pk)
+            renditions, failure = None, 'error'
+        else:
+            # a missing original may be restored, nothing is stored so it is rendered again then
+            failure = 'missing' if renditions is None else None
+
+        with self._lock:
+            self._pending.discard(pk)
+            if failure:
+                self._failed.set(pk, (failure, time.monotonic()))
+            else:
+                self._results.append((pk, renditions.get('thumb'), renditions))
+            batch = None
+            if self._results and (len(self._results) >= self.batch_size or not self._pending):
+                batch, self._results = self._results, []
+        if batch:
+            self._write(batch)
+        if self.workers > 0:
+            close_old_connections()
+
+    def _write(self, batch):
+        image_file_model = apps.get_model('core', 'ImageFile')
+        try:
+            image_file_model.objects.bulk_update(
+                [image_file_model(pk=pk, thumbnail=thumbnail, renditions=renditions)
+                 for pk, thumbnail, renditions in batch],
+                ['thumbnail', 'renditions'], batch_size=self.batch_size)
+        except Exception:
+            logger.exception('Could not store %s generated thumbnails', len(batch))
+
+
+thumbnail_pipeline = ThumbnailPipeline()
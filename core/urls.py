@@ -4,8 +4,9 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework import routers
 
+from utils import async_views as account_async_views
 from utils.viewsets import AdminToolsViewSet, AccountViewSet
-from . import views
+from . import async_views, views
 from .viewsets import LoginViewSet, RefreshViewSet, ChangePasswordView, UserViewSet
 
 router = routers.SimpleRouter()
@@ -25,6 +26,13 @@ urlpatterns = [
     path('', include('mailer.urls')),
     path('api/', include(router.urls)),
     path('api/auth/change_password/', ChangePasswordView.as_view()),
+    # async versions of the auth and notification endpoints, for ASGI workers
+    path('api/async/auth/login/', async_views.login),
+    path('api/async/auth/refresh/', async_views.refresh),
+    path('api/async/account/notifications/', account_async_views.notifications),
+    path('api/async/account/<int:pk>/read_notification/', account_async_views.read_notification),
+    path('api/async/account/dismiss_all_notifications/', account_async_views.dismiss_all_notifications),
+    path('api/files/<str:file_type>/<int:pk>/download/', views.FileDownloadView.as_view(), name='file-download'),
     path('api/auth/password_reset/',
          include('django_rest_passwordreset.urls', namespace='password_reset')),
     *static(settings.STATIC_URL, document_root=settings.STATIC_ROOT),
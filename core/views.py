@@ -5,7 +5,13 @@ from urllib.parse import urlparse
 from django.views.generic import View
 from django.conf import settings
 from django.shortcuts import render, get_object_or_404
-from django.http import HttpResponse
+from django.http import HttpResponse, Http404
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+
+from .downloads import serve_file
+from .models import File, ImageFile
 # Create your views here.
 
 
@@ -34,4 +40,29 @@ class FrontendAppView(View):
                 version of the app.
                 """,
                 status=501,
-            )
\ No newline at end of file
+            )
+
+
+class FileDownloadView(APIView):
+    """
+    Permission checked download of File / ImageFile uploads, see core.downloads.serve_file.
+    """
+    permission_classes = (IsAuthenticated,)
+    file_models = {
+        'file': File,
+        'image': ImageFile,
+    }
+
+    def get(self, request, file_type, pk):
+        model = self.file_models.get(file_type)
+        if model is None:
+            raise Http404
+        if not request.user.has_perm(f'{model._meta.app_label}.view_{model._meta.model_name}'):
+            raise PermissionDenied({"message": "You don't have permission to download this file"})
+        instance = get_object_or_404(model, pk=pk)
+        if not instance.file:
+            raise Http404
+        try:
+            return serve_file(request, instance, as_attachment=request.query_params.get('inline') is None)
+        except FileNotFoundError:
+            raise Http404
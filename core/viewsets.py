@@ -1,4 +1,4 @@
-from django.contrib.admin.models import CHANGE
+from django.contrib.admin.models import CHANGE, LogEntry
 from django.contrib.auth import get_user_model
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
@@ -10,8 +10,9 @@ from rest_framework_simplejwt.exceptions import TokenError, InvalidToken
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 from .models import Note
+from .pagination import LogEntryPagination
 from .serializers import NoteSerializer, UserInfoSerializer, UserAccountSerializer, LoginSerializer, \
-    ChangePasswordSerializer
+    ChangePasswordSerializer, LogEntrySerializer, RefreshSerializer
 
 User = get_user_model()
 
@@ -64,13 +65,29 @@ class NotesMixin:
         return Response(NoteSerializer(note).data)
 
 
+class HistoryMixin:
+    """
+    Paginated history of an entity, linked from EntitySerializer when ENTITY_HISTORY_MODE = 'url'.
+    """
+
+    @action(methods=["get"], detail=True,
+            url_path="history", url_name="history")
+    def history(self, request, pk=None):
+        instance = self.get_object()
+        queryset = instance.history()
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(LogEntrySerializer(page, many=True).data)
+        return Response(LogEntrySerializer(queryset, many=True).data)
+
+
 class UserViewSet(viewsets.ModelViewSet):
     http_method_names = ['get']
     serializer_class = UserInfoSerializer
     permission_classes = (IsAuthenticated,)
     filter_backends = [filters.OrderingFilter]
-    ordering_fields = ['updated']
-    ordering = ['-updated']
+    ordering_fields = ['date_joined', 'username']
+    ordering = ['-date_joined']
 
     def get_queryset(self):
         if self.request.user.is_superuser:
@@ -87,7 +104,16 @@ class UserViewSet(viewsets.ModelViewSet):
     @action(methods=["GET"], detail=False)
     def account(self, request):
         user = request.user
-        return Response(UserAccountSerializer(user).data)
+        return Response(UserAccountSerializer(user, context={'request': request}).data)
+
+    @action(methods=["GET"], detail=False, pagination_class=LogEntryPagination)
+    def activity(self, request):
+        """
+        The actions of the current user, newest first, by keyset pages (see core.pagination.KeysetPagination).
+        """
+        queryset = LogEntry.objects.select_related('user').filter(user=request.user)
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(LogEntrySerializer(page, many=True).data)
 
 
 class LoginViewSet(viewsets.ModelViewSet, TokenObtainPairView):
@@ -107,6 +133,7 @@ class LoginViewSet(viewsets.ModelViewSet, TokenObtainPairView):
 
 
 class RefreshViewSet(viewsets.ViewSet, TokenRefreshView):
+    serializer_class = RefreshSerializer
     permission_classes = (AllowAny,)
     http_method_names = ['post']
 
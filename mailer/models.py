@@ -10,7 +10,7 @@ from django.contrib.auth import get_user_model
 from tinymce.models import HTMLField
 
 from core.models import EntityModel
-from core.fns import get_object_view_link, flatten_dict
+from core.fns import get_object_view_link, FlatView, replace_placeholders
 from core.serializers import UserInfoSerializer
 
 User = get_user_model()
@@ -52,13 +52,9 @@ def send_mail_template(name, recipients, replacements={}, reply_to=None, attach_
     subject = template.subject
     msg_text = template.msg_text
     msg_html = template.msg_html
-    tmp = [subject := subject.replace('{' + key + '}', replacements[key]) for key in replacements.keys() if
-           isinstance(replacements[key], str) and '{' + key + '}' in subject]
-    tmp = [msg_text := msg_text.replace('{' + key + '}', replacements[key]) for key in replacements.keys() if
-           isinstance(replacements[key], str) and '{' + key + '}' in msg_text]
-    tmp = [msg_html := msg_html.replace('{' + key + '}', replacements[key]) for key in replacements.keys() if
-           isinstance(replacements[key], str) and '{' + key + '}' in msg_html]
-    del tmp
+    subject = replace_placeholders(subject, replacements)
+    msg_text = replace_placeholders(msg_text, replacements)
+    msg_html = replace_placeholders(msg_html, replacements)
 
     msg = EmailMultiAlternatives(subject, msg_text, from_email, recipients)
     msg.attach_alternative(msg_html, "text/html")
@@ -161,13 +157,12 @@ class Notification(EntityModel):
         if from_user:
             n_replacements['from_user'] = UserInfoSerializer(from_user).data
 
-        n_replacements = flatten_dict(n_replacements)
+        # flat keys ('user_first_name') are only resolved for the placeholders the templates use
+        flat_replacements = FlatView(n_replacements)
 
         if email_template and not message:
             notification_msg = str(EmailTemplate.objects.get(name=email_template).notification_msg or '')
-            if n_replacements:
-                __ = [notification_msg := notification_msg.replace('{' + key + '}', n_replacements[key]) for key in n_replacements.keys() if
-                       isinstance(n_replacements[key], str) and '{' + key + '}' in notification_msg]
+            notification_msg = replace_placeholders(notification_msg, flat_replacements)
         else:
             notification_msg = str(message or '')
             if notification_msg and notification_msg.startswith(':'):
@@ -221,7 +216,7 @@ class Notification(EntityModel):
                 email_template = Notification.DEFAULT_EMAIL_TEMPLATE
                 if action == 'link' and target_object and target_object_id:
                     email_template = email_template + '_link'
-            send_mail_template(email_template, [user.email], n_replacements)
+            send_mail_template(email_template, [user.email], flat_replacements)
         return notification
 
     class Meta:
@@ -0,0 +1,36 @@
+from django.http import JsonResponse
+from rest_framework.exceptions import NotFound, PermissionDenied
+from rest_framework.request import Request
+
+from core.async_views import async_api_view
+from core.pagination import ListLimitOffsetPagination
+from mailer.models import Notification
+from utils.viewsets import notifications_response
+
+
+@async_api_view(['GET'])
+async def notifications(request):
+    notifications = Notification.objects.select_related('user', 'from_user').filter(
+        user=request.user, seen=False)
+    request = Request(request)
+    paginator = ListLimitOffsetPagination()
+    notifications_paginated = await paginator.apaginate_queryset(notifications, request)
+    return JsonResponse(notifications_response(request, paginator, notifications_paginated))
+
+
+@async_api_view(['PUT'])
+async def read_notification(request, pk):
+    notification = await Notification.objects.filter(pk=pk).afirst()
+    if notification is None:
+        raise NotFound()
+    if notification.user_id != request.user.pk:
+        raise PermissionDenied({"message": "Not allowed!"})
+    notification.seen = True
+    await notification.asave()
+    return JsonResponse({'success': 'success'})
+
+
+@async_api_view(['PUT'])
+async def dismiss_all_notifications(request):
+    await Notification.objects.filter(user=request.user, seen=False).aupdate(seen=True)
+    return JsonResponse({'success': 'success'})
@@ -7,6 +7,9 @@ from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 
+from core.authentication import user_cache
+from core.last_seen import last_seen_tracker
+from core.pagination import ListLimitOffsetPagination
 from mailer.models import Notification
 from mailer.serializers import NotificationSerializer
 
@@ -24,6 +27,31 @@ class AdminToolsViewSet(viewsets.ViewSet):
     def test(self, request):
         return Response({'success': 'success'})
 
+    @action(methods=["get"], url_path="metrics",
+            detail=False, url_name="metrics")
+    def metrics(self, request):
+        return Response({
+            'last_seen': last_seen_tracker.stats(),
+            'user_cache': user_cache.stats(),
+        })
+
+
+def notifications_response(request, paginator, notifications):
+    query_meta = {}
+    if int(request.query_params.get('offset', 0)) == 0:
+        query_meta['notifications'] = {
+            'count': paginator.count,
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
+        }
+    notes = [{**e, 'objectId': e['object_id'], 'date': e['created_at']}
+             for e in NotificationSerializer(notifications, many=True).data]
+    return {
+        'status': 'ok',
+        'notifications': sorted(notes, key=itemgetter('date'), reverse=True),
+        'meta': query_meta,
+    }
+
 
 class AccountViewSet(viewsets.ViewSet):
     permission_classes = (IsAuthenticated,)
@@ -31,37 +59,11 @@ class AccountViewSet(viewsets.ViewSet):
     @action(methods=["get"], url_path="notifications",
             detail=False, url_name="notifications")
     def notifications(self, request):
-        notes = []
         notifications = Notification.objects.select_related('user', 'from_user').filter(
-            user=request.user, seen=False),
-        notifications_paginator = LimitOffsetPagination()
-        notifications_paginated = notifications_paginator.paginate_queryset(notifications, request)
-        if int(request.query_params.get('offset', 0)) == 0:
-            query_meta['notifications'] = {
-                'count': notifications_paginator.count,
-                'next': notifications_paginator.get_next_link(),
-                'previous': notifications_paginator.get_previous_link(),
-            }
-        for e in NotificationSerializer(notifications_paginated, many=True).data:
-            n = {
-                **e,
-                'id': e['id'],
-                'type': e['type'],
-                'object': e['object'],
-                'objectId': e['object_id'],
-                'action': e['action'],
-                'message': e['message'],
-                'date': e['created_at'],
-                'data': e['data'],
-            }
-            notes.append(n)
-        response = {
-            'status': 'ok',
-            'notifications': sorted(notes, key=itemgetter('date'), reverse=True),
-            'meta': query_meta,
-        }
-        # fetch new messages
-        return Response(response)
+            user=request.user, seen=False)
+        paginator = ListLimitOffsetPagination()
+        notifications_paginated = paginator.paginate_queryset(notifications, request)
+        return Response(notifications_response(request, paginator, notifications_paginated))
 
     @action(methods=["put"], url_path="read_notification",
             detail=True, url_name="read_notification")